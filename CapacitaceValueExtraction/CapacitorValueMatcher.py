@@ -9,6 +9,12 @@ import pickle
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 
+# Compiled once; these run for every row
+R_CODE_RE = re.compile(r'\d*R\d*')
+R_LEADING_RE = re.compile(r'R\d+')
+NUMBER_RE = re.compile(r'[\d.]+')
+UNIT_RE = re.compile(r'[a-zA-Zµ]+')
+
 class CapacitorValueMatcher:
     def __init__(self, input_file_path, output_dir="output", batch_size=10000, num_threads=4, checkpoint_interval=5000, progress_callback=None):
         self.input_file_path = input_file_path
@@ -27,6 +33,9 @@ class CapacitorValueMatcher:
         self.processed_rows = 0
         self.matched_results = []
         self.unmatched_results = []
+        # Results already written to the temp files; checkpoints only append what came after
+        self.saved_matched = 0
+        self.saved_unmatched = 0
 
         self.lock = threading.Lock()
 
@@ -37,13 +46,10 @@ class CapacitorValueMatcher:
                     checkpoint = json.load(f)
                 self.processed_rows = checkpoint.get('processed_rows', 0)
 
-                if os.path.exists(self.matched_temp_file):
-                    with open(self.matched_temp_file, 'rb') as f:
-                        self.matched_results = pickle.load(f)
-
-                if os.path.exists(self.unmatched_temp_file):
-                    with open(self.unmatched_temp_file, 'rb') as f:
-                        self.unmatched_results = pickle.load(f)
+                self.matched_results = self._load_results(self.matched_temp_file)
+                self.unmatched_results = self._load_results(self.unmatched_temp_file)
+                self.saved_matched = len(self.matched_results)
+                self.saved_unmatched = len(self.unmatched_results)
                 return True
             except:
                 return False
@@ -58,10 +64,26 @@ class CapacitorValueMatcher:
         }
         with open(self.checkpoint_file, 'w') as f:
             json.dump(checkpoint, f, indent=2)
-        with open(self.matched_temp_file, 'wb') as f:
-            pickle.dump(self.matched_results, f)
-        with open(self.unmatched_temp_file, 'wb') as f:
-            pickle.dump(self.unmatched_results, f)
+        self._append_results(self.matched_temp_file, self.matched_results, self.saved_matched)
+        self._append_results(self.unmatched_temp_file, self.unmatched_results, self.saved_unmatched)
+        self.saved_matched = len(self.matched_results)
+        self.saved_unmatched = len(self.unmatched_results)
+
+    def _append_results(self, path, results, saved):
+        # Pickle only the new results as one more chunk, instead of rewriting the whole list each time
+        with open(path, 'ab' if saved else 'wb') as f:
+            pickle.dump(results[saved:], f)
+
+    def _load_results(self, path):
+        results = []
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                while True:
+                    try:
+                        results.extend(pickle.load(f))
+                    except EOFError:
+                        break
+        return results
 
     def extract_patterns(self, part_number):
         if pd.isna(part_number) or not isinstance(part_number, str):
@@ -75,8 +97,8 @@ class CapacitorValueMatcher:
             substring = part_number[i:i+4]
             if substring.isdigit():
                 patterns.append(substring)
-        patterns.extend(re.findall(r'\d*R\d*', part_number))
-        patterns.extend(re.findall(r'R\d+', part_number))
+        patterns.extend(R_CODE_RE.findall(part_number))
+        patterns.extend(R_LEADING_RE.findall(part_number))
         return list(set(patterns))
 
     def calculate_values(self, pattern):
@@ -131,11 +153,11 @@ class CapacitorValueMatcher:
         if pd.isna(value_str):
             return 0, 'pf'
         value_str = str(value_str).strip()
-        numeric_match = re.search(r'[\d.]+', value_str)
+        numeric_match = NUMBER_RE.search(value_str)
         if not numeric_match:
             return 0, 'pf'
         numeric_value = float(numeric_match.group())
-        unit_match = re.search(r'[a-zA-Zµ]+', value_str)
+        unit_match = UNIT_RE.search(value_str)
         unit = unit_match.group().lower() if unit_match else 'pf'
         return numeric_value, unit
 
@@ -182,7 +204,7 @@ class CapacitorValueMatcher:
     def process_batch(self, batch_df):
         batch_matched = []
         batch_unmatched = []
-        row_data = [(idx, row) for idx, row in batch_df.iterrows()]
+        row_data = list(zip(batch_df.index, batch_df.to_dict('records')))
         with ThreadPoolExecutor(max_workers=self.num_threads) as executor:
             futures = {executor.submit(self.process_single_row, rd): rd for rd in row_data}
             for future in as_completed(futures):
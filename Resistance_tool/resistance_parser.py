@@ -20,6 +20,16 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# Code patterns, compiled once rather than looked up for every substring tried
+MULTIPLIER_TRAILING_RE = re.compile(r'^(\d{1,3})([KMG])$')
+MULTIPLIER_DECIMAL_RE = re.compile(r'^(\d{1,3})([KMG])(\d{1,3})$')
+R_LEADING_RE = re.compile(r'^R(\d{1,4})$')
+R_MIDDLE_RE = re.compile(r'^(\d{1,3})R(\d{1,3})$')
+# The 4-character rules scan the whole code once; the lookahead reports every (overlapping) window
+RULE1_SCAN_RE = re.compile(r'(?=(\d{3})([A-Z]))')
+RULE2_SCAN_RE = re.compile(r'(?=(\d{2}[A-Z]\d|\d[A-Z]\d{2}|[A-Z]\d{3}|\d{3}[A-Z]))')  # DDLD, DLDD, LDDD, DDDL
+VALUE_UNIT_RE = re.compile(r'^([0-9]*\.?[0-9]+)([a-zA-Z]+)$')
+
 class EnhancedResistanceParser:
     def __init__(self, batch_size=1000, checkpoint_interval=5000):
         """Initialize the parser with configuration"""
@@ -63,7 +73,7 @@ class EnhancedResistanceParser:
         for i in range(len(code) - 1):
             for length in range(2, min(5, len(code) - i + 1)):
                 substring = code[i:i+length]
-                match = re.match(r'^(\d{1,3})([KMG])$', substring)
+                match = MULTIPLIER_TRAILING_RE.match(substring)
                 if match:
                     digits, multiplier_char = match.groups()
                     base_value = float(digits)
@@ -86,7 +96,7 @@ class EnhancedResistanceParser:
         for i in range(len(code) - 2):
             for length in range(3, min(6, len(code) - i + 1)):
                 substring = code[i:i+length]
-                match = re.match(r'^(\d{1,3})([KMG])(\d{1,3})$', substring)
+                match = MULTIPLIER_DECIMAL_RE.match(substring)
                 if match:
                     before, multiplier_char, after = match.groups()
                     base_value = float(f"{before}.{after}")
@@ -113,7 +123,7 @@ class EnhancedResistanceParser:
 
         # Pattern 1: R followed by digits (R047, R100, R22)
         for i in range(len(code) - 1):
-            match = re.match(r'^R(\d{1,4})$', code[i:i+5] if i+5 <= len(code) else code[i:])
+            match = R_LEADING_RE.match(code[i:i+5] if i+5 <= len(code) else code[i:])
             if match:
                 digits = match.group(1)
                 if len(digits) == 1:
@@ -140,7 +150,7 @@ class EnhancedResistanceParser:
         for i in range(len(code) - 2):
             for length in range(3, min(6, len(code) - i + 1)):
                 substring = code[i:i+length]
-                match = re.match(r'^(\d{1,3})R(\d{1,3})$', substring)
+                match = R_MIDDLE_RE.match(substring)
                 if match:
                     before, after = match.groups()
                     value = float(f"{before}.{after}")
@@ -163,29 +173,25 @@ class EnhancedResistanceParser:
         """Rule 1: 4-digit pattern with single character (decimal multiplier)"""
         results = []
 
-        for i in range(len(code) - 3):
-            substring = code[i:i+4]
+        # Pattern: 3 digits + 1 character
+        for match in RULE1_SCAN_RE.finditer(code):
+            digits, char = match.groups()
+            if char in self.rule1_multipliers:
+                base_value = float(digits)
+                multiplier = self.rule1_multipliers[char]
+                value = base_value * multiplier
 
-            # Pattern: 3 digits + 1 character
-            match = re.match(r'^(\d{3})([A-Z])$', substring)
-            if match:
-                digits, char = match.groups()
-                if char in self.rule1_multipliers:
-                    base_value = float(digits)
-                    multiplier = self.rule1_multipliers[char]
-                    value = base_value * multiplier
-
-                    results.append({
-                        'pattern': substring,
-                        'type': '4-digit-rule1',
-                        'rule': f'Rule1-{char}',
-                        'value': value,
-                        'unit': 'Ohm',
-                        'position': i,
-                        'base_digits': digits,
-                        'multiplier_char': char,
-                        'multiplier_value': multiplier
-                    })
+                results.append({
+                    'pattern': digits + char,
+                    'type': '4-digit-rule1',
+                    'rule': f'Rule1-{char}',
+                    'value': value,
+                    'unit': 'Ohm',
+                    'position': match.start(),
+                    'base_digits': digits,
+                    'multiplier_char': char,
+                    'multiplier_value': multiplier
+                })
 
         return results
 
@@ -193,53 +199,43 @@ class EnhancedResistanceParser:
         """Rule 2: 4-character code with character replacing decimal point"""
         results = []
 
-        patterns = [
-            r'^(\d{2})([A-Z])(\d)$',    # DDLD
-            r'^(\d)([A-Z])(\d{2})$',    # DLDD
-            r'^([A-Z])(\d{3})$',        # LDDD
-            r'^(\d{3})([A-Z])$',        # DDDL
-        ]
-
-        for i in range(len(code) - 3):
-            substring = code[i:i+4]
-            for pattern in patterns:
-                match = re.match(pattern, substring)
-                if match:
-                    if pattern == r'^(\d{3})([A-Z])$':
-                        before, char = match.groups()
-                        base_value = f"{before}.0"
-                    elif pattern == r'^([A-Z])(\d{3})$':
-                        char, after = match.groups()
-                        base_value = f"0.{after}"
-                    else:
-                        before, char, after = match.groups()
-                        base_value = f"{before}.{after}"
-
-                    # Multiplier mapping
-                    if char in self.rule2_no_multiplier:
-                        multiplier = 1
-                        rule_type = "no-multiplier"
-                    elif char in self.rule2_1k_multiplier:
-                        multiplier = 1e3
-                        rule_type = "1k-multiplier"
-                    elif char in self.rule2_1m_multiplier:
-                        multiplier = 1e6
-                        rule_type = "1m-multiplier"
-                    else:
-                        continue
+        for match in RULE2_SCAN_RE.finditer(code):
+            substring = match.group(1)
+            # The shapes differ only in where the single letter sits
+            k = next(j for j, ch in enumerate(substring) if 'A' <= ch <= 'Z')
+            char = substring[k]
+            if k == 3:
+                base_value = f"{substring[:3]}.0"
+            elif k == 0:
+                base_value = f"0.{substring[1:]}"
+            else:
+                base_value = f"{substring[:k]}.{substring[k + 1:]}"
+
+            # Multiplier mapping
+            if char in self.rule2_no_multiplier:
+                multiplier = 1
+                rule_type = "no-multiplier"
+            elif char in self.rule2_1k_multiplier:
+                multiplier = 1e3
+                rule_type = "1k-multiplier"
+            elif char in self.rule2_1m_multiplier:
+                multiplier = 1e6
+                rule_type = "1m-multiplier"
+            else:
+                continue
 
-                    value = float(base_value) * multiplier
-                    results.append({
-                        'pattern': substring,
-                        'type': '4-digit-rule2',
-                        'rule': f'Rule2-{char}-{rule_type}',
-                        'value': value,
-                        'unit': 'Ohm',
-                        'position': i,
-                        'base_digits': base_value,
-                        'multiplier_char': char,
-                        'multiplier_value': multiplier
-                    })
+            value = float(base_value) * multiplier
+            results.append({
+                'pattern': substring,
+                'type': '4-digit-rule2',
+                'rule': f'Rule2-{char}-{rule_type}',
+                'value': value,
+                'unit': 'Ohm',
+                'position': match.start(),
+                'base_digits': base_value,
+                'multiplier_char': char,
+                'multiplier_value': multiplier
+            })
 
         return results
 
@@ -329,7 +325,7 @@ class EnhancedResistanceParser:
             return None
 
         value_str = str(value_str).replace(" ", "").replace("Ω", "Ohm")
-        match = re.match(r'^([0-9]*\.?[0-9]+)([a-zA-Z]+)$', value_str)
+        match = VALUE_UNIT_RE.match(value_str)
         if not match:
             return None
 
@@ -397,7 +393,8 @@ class EnhancedResistanceParser:
         self.total_rows = len(df)
         self.start_time = time.time()
 
-        for idx, row in df.iterrows():
+        # Plain dicts per row: much cheaper than iterrows' Series and keep .get for optional columns
+        for idx, row in zip(df.index, df.to_dict('records')):
             part = str(row['PartNumber'])
             original_value = str(row.get('Value', '')).strip()
             converted_val = self.convert_to_ohm(original_value)
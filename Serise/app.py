@@ -1,8 +1,11 @@
 import streamlit as st
 import pandas as pd
 import requests
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
 
+from utils import EXCEL_READ_ENGINE, EXCEL_WRITE_ENGINE, load_from_github, match_series
+
 # =========================
 # URLs for template files
 # =========================
@@ -13,49 +16,23 @@ TEMPLATE_RULES_URL = "https://raw.githubusercontent.com/AbdallahHesham44/z2Tools
 # =========================
 # Utility functions
 # =========================
-def load_from_github(url):
-    """Load Excel file from a GitHub raw URL."""
-    resp = requests.get(url)
-    resp.raise_for_status()
-    return pd.read_excel(BytesIO(resp.content), engine="openpyxl")
-
 def df_to_excel_bytes(df):
     """Convert DataFrame to Excel bytes for download."""
     output = BytesIO()
-    df.to_excel(output, index=False, engine="openpyxl")
+    # xlsxwriter would turn URL-like values into hyperlinks (capped per sheet); keep them as text
+    engine_kwargs = {"options": {"strings_to_urls": False}} if EXCEL_WRITE_ENGINE == "xlsxwriter" else {}
+    with pd.ExcelWriter(output, engine=EXCEL_WRITE_ENGINE, engine_kwargs=engine_kwargs) as writer:
+        df.to_excel(writer, index=False)
     return output.getvalue()
 
-def match_series(comparison_df, master_df, rules_df, top_n):
-    """Match requested series with master data applying rules."""
-    results = []
-    unique_requests = comparison_df["RequestedSeries"].dropna().unique()
-    total = len(unique_requests)
-
-    progress_bar = st.progress(0)
-    status_text = st.empty()
-
-    for i, requested in enumerate(unique_requests, start=1):
-        status_text.text(f"Processing {i}/{total}: {requested}")
-        progress_bar.progress(i / total)
-
-        matches = master_df[master_df["SeriesName"].str.contains(str(requested), case=False, na=False)].copy()
-        if not matches.empty:
-            matches["UsagePercent"] = matches["UsageCount"] / matches["UsageCount"].sum() * 100
-            matches["RequestedSeries"] = requested
-            matches = matches.sort_values("UsagePercent", ascending=False).head(top_n)
-            results.append(matches)
-        else:
-            results.append(pd.DataFrame([{"RequestedSeries": requested, "SeriesName": None, "UsagePercent": 0}]))
-
-    result_df = pd.concat(results, ignore_index=True)
-
-    if "MinUsagePercent" in rules_df.columns:
-        min_threshold = rules_df["MinUsagePercent"].max()
-        result_df = result_df[result_df["UsagePercent"] >= min_threshold]
-
-    progress_bar.empty()
-    status_text.empty()
-    return result_df
+@st.cache_data(ttl=24 * 3600, show_spinner=False)
+def template_bytes(*urls):
+    """
+    Template workbooks ready for download, fetched concurrently over one session;
+    cached since templates rarely change.
+    """
+    with requests.Session() as session, ThreadPoolExecutor(max_workers=len(urls)) as executor:
+        return list(executor.map(lambda url: df_to_excel_bytes(load_from_github(url, session)), urls))
 
 # =========================
 # Streamlit App UI
@@ -65,21 +42,24 @@ st.title("📊 Series Matching Tool")
 
 # Sidebar downloads
 st.sidebar.header("📥 Download Templates")
+master_template, input_template, rules_template = template_bytes(
+    TEMPLATE_MASTER_URL, TEMPLATE_INPUT_URL, TEMPLATE_RULES_URL
+)
 st.sidebar.download_button(
     label="Download Master Template",
-    data=df_to_excel_bytes(load_from_github(TEMPLATE_MASTER_URL)),
+    data=master_template,
     file_name="TempleteMasterSeriesHistory.xlsx",
     mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
 )
 st.sidebar.download_button(
     label="Download Input Template",
-    data=df_to_excel_bytes(load_from_github(TEMPLATE_INPUT_URL)),
+    data=input_template,
     file_name="TempleteInput_series.xlsx",
     mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
 )
 st.sidebar.download_button(
     label="Download Rules Template",
-    data=df_to_excel_bytes(load_from_github(TEMPLATE_RULES_URL)),
+    data=rules_template,
     file_name="TempleteSampleSeriesRules.xlsx",
     mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
 )
@@ -94,9 +74,10 @@ top_n = st.number_input("Top N Matches", min_value=1, max_value=20, value=5)
 # Process matching
 if st.button("🔍 Run Matching"):
     if comparison_file and master_file and rules_file:
-        comparison_df = pd.read_excel(comparison_file)
-        master_df = pd.read_excel(master_file)
-        rules_df = pd.read_excel(rules_file)
+        # Only RequestedSeries and MinUsagePercent are read from the input and rules files
+        comparison_df = pd.read_excel(comparison_file, engine=EXCEL_READ_ENGINE, usecols=lambda c: c == "RequestedSeries")
+        master_df = pd.read_excel(master_file, engine=EXCEL_READ_ENGINE)
+        rules_df = pd.read_excel(rules_file, engine=EXCEL_READ_ENGINE, usecols=lambda c: c == "MinUsagePercent")
 
         result_df = match_series(comparison_df, master_df, rules_df, top_n)
         st.success("✅ Matching completed!")
@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import utils
+
+
+def match_series_per_request(comparison_df, master_df, rules_df, top_n):
+    """The former per-request loop: one frame per request, concatenated in turn."""
+    results = []
+    for requested in comparison_df["RequestedSeries"].dropna().unique():
+        mask = master_df["SeriesName"].str.contains(requested, case=False, na=False, regex=False)
+        rows = master_df[mask].copy()
+        if len(rows):
+            rows["UsagePercent"] = rows["UsageCount"] / rows["UsageCount"].sum() * 100
+            rows = rows.sort_values("UsagePercent", ascending=False, kind="stable").head(top_n)
+            rows["RequestedSeries"] = requested
+            results.append(rows)
+        else:
+            results.append(pd.DataFrame([{"RequestedSeries": requested, "SeriesName": None, "UsagePercent": 0}]))
+    result_df = pd.concat(results, ignore_index=True)
+    if "MinUsagePercent" in rules_df.columns:
+        result_df = result_df[result_df["UsagePercent"] >= rules_df["MinUsagePercent"].max()]
+    return result_df
+
+
+MASTER = pd.DataFrame({"SeriesName": ["ABC1", "ABC2", "XY"], "UsageCount": [3, 1, 2], "PartID": [101, 102, 103]})
+
+
+@pytest.mark.parametrize("requests", [["ABC", "XY"], ["ABC", "nope", "XY"], ["nope", "ABC"], ["nope"]])
+@pytest.mark.parametrize("aho", [True, False])
+def test_match_series_matches_per_request_concat(monkeypatch, requests, aho):
+    if not aho:
+        monkeypatch.setattr(utils, "ahocorasick", None)
+    comparison_df = pd.DataFrame({"RequestedSeries": requests})
+    rules_df = pd.DataFrame({"Rule": []})
+
+    expected = match_series_per_request(comparison_df, MASTER, rules_df, top_n=5)
+    result = utils.match_series(comparison_df, MASTER, rules_df, top_n=5)
+
+    pd.testing.assert_frame_equal(result, expected)
+
+
+def test_match_series_keeps_integer_columns_when_every_request_hits():
+    comparison_df = pd.DataFrame({"RequestedSeries": ["ABC", "XY"]})
+    result = utils.match_series(comparison_df, MASTER, pd.DataFrame(), top_n=5)
+
+    assert result["UsageCount"].dtype == np.int64
+    assert result["PartID"].tolist() == [101, 102, 103]
@@ -1,44 +1,142 @@
+import hashlib
+import os
+import tempfile
+import numpy as np
 import pandas as pd
 import requests
 from io import BytesIO
 import streamlit as st
 
-def load_from_github(url):
-    """Load an Excel file from a GitHub raw link."""
-    resp = requests.get(url)
+try:
+    import ahocorasick
+except ImportError:  # fall back to one substring scan per request when pyahocorasick is not installed
+    ahocorasick = None
+
+# calamine reads the GitHub workbooks and xlsxwriter writes downloads, when installed
+try:
+    import python_calamine  # noqa: F401
+    EXCEL_READ_ENGINE = "calamine"
+except ImportError:
+    EXCEL_READ_ENGINE = "openpyxl"
+try:
+    import xlsxwriter  # noqa: F401
+    EXCEL_WRITE_ENGINE = "xlsxwriter"
+except ImportError:
+    EXCEL_WRITE_ENGINE = "openpyxl"
+
+# Local copies of downloaded files, revalidated with the server's ETag
+DOWNLOAD_CACHE_DIR = os.path.join(tempfile.gettempdir(), "z2tools_cache")
+
+def fetch_bytes(url, session=requests):
+    """Download a file, revalidating the cached copy with its ETag (reused on 304 Not Modified)."""
+    # ETag line and content are kept in one file, replaced in one step, so they always match
+    cache_path = os.path.join(DOWNLOAD_CACHE_DIR, hashlib.md5(url.encode()).hexdigest() + ".etag-cache")
+    cached = None
+    try:
+        with open(cache_path, "rb") as f:
+            etag, _, content = f.read().partition(b"\n")
+        cached = (etag.decode(), content)
+    except OSError:
+        pass
+
+    headers = {"If-None-Match": cached[0]} if cached else {}
+    resp = session.get(url, headers=headers)
+    if resp.status_code == 304 and cached:
+        return cached[1]
     resp.raise_for_status()
-    return pd.read_excel(BytesIO(resp.content), engine="openpyxl")
+
+    etag = resp.headers.get("ETag")
+    if etag:
+        try:
+            os.makedirs(DOWNLOAD_CACHE_DIR, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=DOWNLOAD_CACHE_DIR)
+            with os.fdopen(fd, "wb") as f:
+                f.write(etag.encode() + b"\n" + resp.content)
+            os.replace(tmp_path, cache_path)
+        except OSError:
+            pass  # the cache is only an optimization
+    return resp.content
+
+def load_from_github(url, session=requests):
+    """Load an Excel file from a GitHub raw link."""
+    return pd.read_excel(BytesIO(fetch_bytes(url, session)), engine=EXCEL_READ_ENGINE)
+
+def find_substring_hits(names, patterns):
+    """
+    Return, for each pattern, the positions of the names that contain it
+    (case-insensitive, literal). With pyahocorasick all patterns are found in
+    a single sweep over the names.
+    """
+    if ahocorasick is None:
+        # Casefold the names once into a fixed-width array, then one C-level find per pattern
+        is_str = names.map(lambda name: isinstance(name, str)).to_numpy(dtype=bool)
+        folded = np.array([name.casefold() if ok else "" for name, ok in zip(names, is_str)], dtype=str)
+        return [np.flatnonzero((np.char.find(folded, str(p).casefold()) >= 0) & is_str) for p in patterns]
+
+    hits = [[] for _ in patterns]
+    every_name = []
+    automaton = ahocorasick.Automaton()
+    for i, pattern in enumerate(patterns):
+        word = str(pattern).casefold()
+        if word:
+            automaton.add_word(word, automaton.get(word, ()) + (i,))
+        else:
+            every_name.append(i)  # an empty pattern is contained in every name
+    if len(automaton):
+        automaton.make_automaton()
+
+    for pos, name in enumerate(names):
+        if not isinstance(name, str):
+            continue
+        found = set(every_name)
+        if len(automaton):
+            for _, ids in automaton.iter(name.casefold()):
+                found.update(ids)
+        for i in found:
+            hits[i].append(pos)
+    return hits
 
 def match_series(comparison_df, master_df, rules_df, top_n):
     """Match requested series with master series using rules."""
-    results = []
     unique_requests = comparison_df["RequestedSeries"].dropna().unique()
-    total = len(unique_requests)
 
-    progress_bar = st.progress(0)
-    status_text = st.empty()
+    with st.spinner(f"Matching {len(unique_requests)} requested series..."):
+        # Containment of every request in every master name, found up front
+        hits = find_substring_hits(master_df["SeriesName"], unique_requests)
 
-    for i, requested in enumerate(unique_requests, start=1):
-        status_text.text(f"Processing {i}/{total}: {requested}")
-        progress_bar.progress(i / total)
+    # One long (request, master row) table instead of a sorted frame per request
+    counts = np.array([len(h) for h in hits], dtype=np.intp)
+    request_idx = np.repeat(np.arange(len(hits)), counts)
+    master_idx = np.concatenate([np.asarray(h, dtype=np.intp) for h in hits] + [np.empty(0, dtype=np.intp)])
+    usage = master_df["UsageCount"].to_numpy(dtype=float)[master_idx]
+    totals = np.bincount(request_idx, weights=np.nan_to_num(usage), minlength=len(hits))
+    percent = usage / totals[request_idx] * 100
 
-        matches = master_df[master_df["SeriesName"].str.contains(str(requested), case=False, na=False)].copy()
+    # Highest UsagePercent first within each request (NaN last, ties in master order), top_n kept
+    order = np.lexsort((master_idx, -percent, request_idx))
+    rank = np.arange(len(order)) - np.searchsorted(request_idx[order], request_idx[order])
+    order = order[rank < top_n]
 
-        if not matches.empty:
-            matches["UsagePercent"] = matches["UsageCount"] / matches["UsageCount"].sum() * 100
-            matches["RequestedSeries"] = requested
-            matches = matches.sort_values("UsagePercent", ascending=False).head(top_n)
-            results.append(matches)
-        else:
-            results.append(pd.DataFrame([{"RequestedSeries": requested, "SeriesName": None, "UsagePercent": 0}]))
+    matches = master_df.iloc[master_idx[order]].copy()
+    matches["UsagePercent"] = percent[order]
+    matches["RequestedSeries"] = unique_requests[request_idx[order]]
+    missing = np.flatnonzero(counts == 0)
+    misses = pd.DataFrame({"RequestedSeries": unique_requests[missing], "SeriesName": None, "UsagePercent": 0})
 
-    result_df = pd.concat(results, ignore_index=True)
+    # Back in request order, with the columns laid out as if each request's rows were concatenated in turn;
+    # an empty frame is left out of the concat so it cannot upcast the master's integer columns
+    frames = [matches] if counts.any() else []
+    if missing.size or not frames:
+        frames.append(misses)
+    result_df = pd.concat(frames, ignore_index=True)
+    result_df = result_df.iloc[np.argsort(np.concatenate([request_idx[order], missing]), kind="stable")]
+    result_df = result_df.reset_index(drop=True)
+    if len(counts) and counts[0] == 0:
+        leading = list(misses.columns)
+        result_df = result_df[leading + [c for c in result_df.columns if c not in leading]]
 
     if "MinUsagePercent" in rules_df.columns:
         min_threshold = rules_df["MinUsagePercent"].max()
         result_df = result_df[result_df["UsagePercent"] >= min_threshold]
 
-    progress_bar.empty()
-    status_text.empty()
-
     return result_df
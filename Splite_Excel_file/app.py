@@ -2,33 +2,48 @@ import streamlit as st
 import pandas as pd
 import zipfile
 import os
-import tempfile
 from io import BytesIO
 
+# Reader for the upload and writer for the parts; openpyxl if not installed
+try:
+    import python_calamine  # noqa: F401
+    EXCEL_READ_ENGINE = "calamine"
+except ImportError:
+    EXCEL_READ_ENGINE = "openpyxl"
+try:
+    import xlsxwriter  # noqa: F401
+    EXCEL_WRITE_ENGINE = "xlsxwriter"
+except ImportError:
+    EXCEL_WRITE_ENGINE = "openpyxl"
+
+def _write_chunk(chunk):
+    """One part as in-memory xlsx bytes."""
+    buf = BytesIO()
+    # xlsxwriter would turn URL-like values into hyperlinks (capped per sheet); keep them as text
+    engine_kwargs = {"options": {"strings_to_urls": False}} if EXCEL_WRITE_ENGINE == "xlsxwriter" else {}
+    chunk.to_excel(buf, index=False, engine=EXCEL_WRITE_ENGINE, engine_kwargs=engine_kwargs)
+    return buf.getvalue()
+
 def split_excel_file(df, selected_columns, rows_per_file, base_name, progress_callback):
+    """Return (file name, xlsx bytes) for each part of df."""
     df = df[selected_columns]  # keep only selected columns
-    output_files = []
     total_rows = len(df)
     num_files = (total_rows + rows_per_file - 1) // rows_per_file
+    names = [f"{base_name}_part_{i+1}.xlsx" for i in range(num_files)]
+    chunks = [df.iloc[i * rows_per_file:(i + 1) * rows_per_file] for i in range(num_files)]
 
-    for i in range(num_files):
-        start = i * rows_per_file
-        end = min(start + rows_per_file, total_rows)
-        chunk = df.iloc[start:end]
-
-        temp_output = tempfile.NamedTemporaryFile(delete=False, suffix='.xlsx')
-        chunk.to_excel(temp_output.name, index=False)
-        output_files.append((f"{base_name}_part_{i+1}.xlsx", temp_output.name))
-
+    output_files = []
+    for i, chunk in enumerate(chunks):
+        output_files.append((names[i], _write_chunk(chunk)))
         progress_callback((i + 1) / num_files)
-
     return output_files
 
 def compress_files_to_zip(file_list):
     zip_buffer = BytesIO()
-    with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zipf:
-        for arcname, filepath in file_list:
-            zipf.write(filepath, arcname)
+    # xlsx parts are already deflate-compressed zip containers; storing them skips a second compression pass
+    with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_STORED) as zipf:
+        for arcname, data in file_list:
+            zipf.writestr(arcname, data)
     zip_buffer.seek(0)
     return zip_buffer
 
@@ -38,7 +53,7 @@ st.title("📊 Excel Splitter & Column Selector")
 uploaded_file = st.file_uploader("Upload a large Excel file (.xlsx)", type=["xlsx"])
 
 if uploaded_file:
-    df = pd.read_excel(uploaded_file)
+    df = pd.read_excel(uploaded_file, engine=EXCEL_READ_ENGINE)
     st.success(f"✅ File loaded with {df.shape[0]} rows and {df.shape[1]} columns.")
 
     # Select columns
@@ -57,16 +72,12 @@ if uploaded_file:
 
             progress_bar = st.progress(0)
 
-            # Split Excel and get list of temporary file paths
+            # Split Excel into in-memory parts
             output_files = split_excel_file(df, selected_columns, rows_per_file, base_name, progress_callback=progress_bar.progress)
 
-            # Compress all parts into a single zip file
+            # Bundle all parts into a single zip file
             zip_buffer = compress_files_to_zip(output_files)
 
-            # Clean up temporary files
-            for _, path in output_files:
-                os.remove(path)
-
             st.success("✅ Done! Download your split files below.")
             st.download_button(
                 label="📥 Download ZIP",
@@ -1,73 +1,167 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import zipfile
 import rarfile
-import tempfile
 import os
+import hashlib
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
-import math
+from openpyxl import load_workbook
+
+from utils import df_to_parquet, df_to_xlsx
+
+# calamine parses workbooks natively; without it xlsx files are streamed read-only with openpyxl
+try:
+    import python_calamine  # noqa: F401
+    EXCEL_READ_ENGINE = "calamine"
+except ImportError:
+    EXCEL_READ_ENGINE = "openpyxl"
+
+try:
+    import libarchive
+except ImportError:  # RAR members are then read through rarfile (which runs unrar)
+    libarchive = None
 
 EXCEL_ROW_LIMIT = 1_048_576  # Excel sheet row limit
 
-def extract_archive(file_buffer, temp_dir, file_type):
-    archive_path = os.path.join(temp_dir, f"uploaded.{file_type}")
-    
-    with open(archive_path, "wb") as f:
-        f.write(file_buffer.getbuffer())
-    
-    extracted_files = []
-
-    if file_type == "zip":
-        with zipfile.ZipFile(archive_path, 'r') as zip_ref:
-            zip_ref.extractall(temp_dir)
-            extracted_files = zip_ref.namelist()
-
-    elif file_type == "rar":
-        with rarfile.RarFile(archive_path, 'r') as rar_ref:
-            rar_ref.extractall(temp_dir)
-            extracted_files = rar_ref.namelist()
-
-    return extracted_files
-
-def merge_excel_files_by_sheets(temp_dir):
-    sheet_data = {}  # {sheet_name: DataFrame}
-
-    for filename in os.listdir(temp_dir):
-        if filename.endswith((".xlsx", ".xls")):
-            file_path = os.path.join(temp_dir, filename)
-            try:
-                # Read all sheets
-                xls = pd.read_excel(file_path, sheet_name=None)
-                for sheet_name, df in xls.items():
-                    if sheet_name not in sheet_data:
-                        sheet_data[sheet_name] = pd.DataFrame()
-                    sheet_data[sheet_name] = pd.concat([sheet_data[sheet_name], df], ignore_index=True)
-            except Exception as e:
-                st.warning(f"❌ Failed to read {filename}: {e}")
-    
-    return sheet_data
+def open_archive(data, file_type):
+    """Open an uploaded zip/rar archive held in memory."""
+    if file_type == "rar":
+        return rarfile.RarFile(BytesIO(data), 'r')
+    return zipfile.ZipFile(BytesIO(data), 'r')
+
+def read_archive_workbooks(data, file_type, read_workbook):
+    """
+    Parse the Excel files at the top level of an uploaded archive straight from memory,
+    without extracting to disk. Members are decompressed and parsed concurrently; each
+    worker reads through its own archive handle (handles are not shared across threads).
+    Returns [(filename, (result, error))] in archive order.
+    """
+    def is_workbook(name):
+        return "/" not in name and name.endswith((".xlsx", ".xls"))
+
+    local = threading.local()
+    handles = []
+
+    if file_type == "rar" and libarchive is not None:
+        # libarchive decodes RAR in-process instead of piping each member through unrar;
+        # its entries stream in order, so they are read here and only parsed in the workers
+        with libarchive.memory_reader(data) as archive:
+            members = {e.pathname: b"".join(e.get_blocks()) for e in archive if e.isfile and is_workbook(e.pathname)}
+        filenames = list(members)
+        read_member = members.__getitem__
+    else:
+        with open_archive(data, file_type) as archive:
+            filenames = [n for n in archive.namelist() if is_workbook(n)]
+
+        def read_member(filename):
+            if not hasattr(local, "archive"):
+                local.archive = open_archive(data, file_type)
+                handles.append(local.archive)
+            return local.archive.read(filename)
+
+    def read_one(filename):
+        try:
+            source = BytesIO(read_member(filename))
+        except Exception as e:
+            return None, e
+        return read_workbook(filename, source)
+
+    try:
+        # zlib inflation and calamine parsing run without the GIL
+        with ThreadPoolExecutor(max_workers=min(len(filenames), os.cpu_count() or 1) or 1) as executor:
+            return list(zip(filenames, executor.map(read_one, filenames)))
+    finally:
+        for handle in handles:
+            handle.close()
+
+def read_xlsx_read_only(source):
+    """
+    Read every sheet of an xlsx file as {sheet_name: DataFrame}, streaming plain cell
+    values from a read-only openpyxl workbook instead of building the full object graph.
+    """
+    wb = load_workbook(source, read_only=True, data_only=True)
+    try:
+        sheets = {}
+        for ws in wb.worksheets:
+            rows = ws.iter_rows(values_only=True)
+            headers = next(rows, None)
+            data = list(rows)
+            if headers is None:
+                sheets[ws.title] = pd.DataFrame()
+                continue
+            # Match read_excel: drop trailing empty rows, name blank headers, empty cells as NaN
+            while data and all(v is None for v in data[-1]):
+                data.pop()
+            headers = [f"Unnamed: {i}" if h is None else h for i, h in enumerate(headers)]
+            sheets[ws.title] = pd.DataFrame(data, columns=headers).fillna(np.nan).infer_objects()
+        return sheets
+    finally:
+        wb.close()
+
+def read_all_sheets(filename, source):
+    """Read every sheet of one workbook; returns ({sheet_name: DataFrame}, None) or (None, error)."""
+    try:
+        if EXCEL_READ_ENGINE == "calamine":
+            return pd.read_excel(source, sheet_name=None, engine="calamine"), None
+        if filename.endswith(".xlsx"):
+            return read_xlsx_read_only(source), None
+        return pd.read_excel(source, sheet_name=None), None
+    except Exception as e:
+        return None, e
+
+def merge_excel_files_by_sheets(data, file_type):
+    sheet_frames = defaultdict(list)  # {sheet_name: [DataFrame, ...]}
+
+    # Merged in archive order
+    for filename, (xls, error) in read_archive_workbooks(data, file_type, read_all_sheets):
+        if error is not None:
+            st.warning(f"❌ Failed to read {filename}: {error}")
+            continue
+        for sheet_name, df in xls.items():
+            sheet_frames[sheet_name].append(df)
+
+    # Concatenate once per sheet instead of re-copying the merged frame for every file
+    return {sheet_name: pd.concat(frames, ignore_index=True) for sheet_name, frames in sheet_frames.items()}
 
 def save_to_excel_with_row_limit(sheet_data):
-    output_files = []
-    
-    for sheet_name, df in sheet_data.items():
+    """
+    Yield (filename, xlsx bytes) one file at a time, splitting sheets over the row limit.
+    Each sheet is popped from sheet_data before it is written, so its frame is freed as
+    soon as its files are done instead of every frame and buffer being held until the end.
+    """
+    for sheet_name in list(sheet_data):
+        df = sheet_data.pop(sheet_name)
         if len(df) > EXCEL_ROW_LIMIT - 1:  # -1 for header
-            num_parts = math.ceil(len(df) / (EXCEL_ROW_LIMIT - 1))
-            for i in range(num_parts):
-                part_df = df.iloc[i*(EXCEL_ROW_LIMIT - 1):(i+1)*(EXCEL_ROW_LIMIT - 1)]
-                output = BytesIO()
-                with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-                    part_df.to_excel(writer, index=False, sheet_name=sheet_name)
-                output.seek(0)
-                output_files.append((f"{sheet_name}_part{i+1}.xlsx", output))
+            # Parts are positional slices of df, written without copying them first
+            for i, start in enumerate(range(0, len(df), EXCEL_ROW_LIMIT - 1)):
+                part_df = df.iloc[start:start + EXCEL_ROW_LIMIT - 1]
+                yield f"{sheet_name}_part{i+1}.xlsx", df_to_xlsx(part_df, sheet_name).getvalue()
         else:
-            output = BytesIO()
-            with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-                df.to_excel(writer, index=False, sheet_name=sheet_name)
-            output.seek(0)
-            output_files.append((f"{sheet_name}.xlsx", output))
-    
-    return output_files
+            yield f"{sheet_name}.xlsx", df_to_xlsx(df, sheet_name).getvalue()
+        del df
+
+@st.cache_data(show_spinner=False, max_entries=2)
+def merge_archive(archive_bytes, file_type):
+    """
+    Merged sheets for one uploaded archive. Cached on the archive bytes, so reruns
+    (e.g. clicking a download button) skip parsing.
+    """
+    return merge_excel_files_by_sheets(archive_bytes, file_type)
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def parquet_download(archive_hash, sheet_name, _df):
+    """
+    Parquet download for one merged sheet, cached on the archive hash and sheet name;
+    returns (bytes, None) or (None, error) so a sheet Parquet cannot hold does not stop the rest.
+    """
+    try:
+        return df_to_parquet(_df), None
+    except Exception as e:
+        return None, e
 
 # --- Streamlit UI ---
 st.set_page_config(page_title="Excel Merger", page_icon="📊")
@@ -77,36 +171,54 @@ st.markdown("""
 🔄 Upload a `.zip` or `.rar` file containing multiple Excel files with the **same sheet names**.
 This tool will merge them **sheet-by-sheet** into final Excel files.
 If any sheet exceeds **1,048,576 rows**, it will be split into multiple files.
+Each merged sheet is also offered as a single **Parquet** file, which has no row limit.
 """)
 
 uploaded_archive = st.file_uploader("📦 Upload ZIP or RAR Folder of Excel Files", type=["zip", "rar"])
+write_xlsx = st.checkbox("Also build Excel (.xlsx) downloads", value=True,
+                         help="Writing xlsx is much slower than Parquet for large sheets.")
 
 if uploaded_archive is not None:
     file_type = uploaded_archive.name.split(".")[-1].lower()
 
     with st.spinner(f"Extracting and merging files from .{file_type}..."):
-        with tempfile.TemporaryDirectory() as temp_dir:
-            try:
-                extract_archive(uploaded_archive, temp_dir, file_type)
-                sheet_data = merge_excel_files_by_sheets(temp_dir)
-            except Exception as e:
-                st.error(f"❌ Failed to process archive: {e}")
-                st.stop()
-
-            if sheet_data:
-                st.success("✅ Files merged successfully!")
-                for sheet_name, df in sheet_data.items():
-                    st.write(f"**Sheet:** {sheet_name} — {len(df)} rows")
-                    st.dataframe(df.head())
-
-                output_files = save_to_excel_with_row_limit(sheet_data)
-                
-                for filename, file_buffer in output_files:
-                    st.download_button(
-                        label=f"⬇️ Download {filename}",
-                        data=file_buffer,
-                        file_name=filename,
-                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                    )
-            else:
-                st.error("⚠️ No Excel files were found or could be processed.")
+        try:
+            archive_bytes = uploaded_archive.getvalue()
+            sheet_data = merge_archive(archive_bytes, file_type)
+            archive_hash = hashlib.md5(archive_bytes).hexdigest()
+        except Exception as e:
+            st.error(f"❌ Failed to process archive: {e}")
+            st.stop()
+
+        if sheet_data:
+            st.success("✅ Files merged successfully!")
+            for sheet_name, df in sheet_data.items():
+                st.write(f"**Sheet:** {sheet_name} — {len(df)} rows")
+                st.dataframe(df.head())
+                parquet_bytes, error = parquet_download(archive_hash, sheet_name, df)
+                if error is not None:
+                    st.warning(f"⚠️ Parquet not available for {sheet_name}: {error}")
+                    continue
+                st.download_button(
+                    label=f"⬇️ Download {sheet_name}.parquet",
+                    data=parquet_bytes,
+                    file_name=f"{sheet_name}.parquet",
+                    mime="application/vnd.apache.parquet"
+                )
+
+            if write_xlsx:
+                # Each file goes to its button as soon as it is written, and its sheet is freed;
+                # clicks don't rerun the script, so the files are not rebuilt on download
+                try:
+                    for filename, file_bytes in save_to_excel_with_row_limit(sheet_data):
+                        st.download_button(
+                            label=f"⬇️ Download {filename}",
+                            data=file_bytes,
+                            file_name=filename,
+                            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                            on_click="ignore"
+                        )
+                except Exception as e:
+                    st.error(f"❌ Failed to write Excel files: {e}")
+        else:
+            st.error("⚠️ No Excel files were found or could be processed.")
@@ -1,45 +1,145 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import zipfile
 import rarfile
-import tempfile
 import os
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
+from openpyxl import load_workbook
 
-def extract_archive(file_buffer, temp_dir, file_type):
-    archive_path = os.path.join(temp_dir, f"uploaded.{file_type}")
-    
-    with open(archive_path, "wb") as f:
-        f.write(file_buffer.getbuffer())
-    
-    extracted_files = []
-
-    if file_type == "zip":
-        with zipfile.ZipFile(archive_path, 'r') as zip_ref:
-            zip_ref.extractall(temp_dir)
-            extracted_files = zip_ref.namelist()
-
-    elif file_type == "rar":
-        with rarfile.RarFile(archive_path, 'r') as rar_ref:
-            rar_ref.extractall(temp_dir)
-            extracted_files = rar_ref.namelist()
-
-    return extracted_files
-
-def merge_excel_files(temp_dir):
-    merged_df = pd.DataFrame()
-
-    for filename in os.listdir(temp_dir):
-        if filename.endswith((".xlsx", ".xls")):
-            file_path = os.path.join(temp_dir, filename)
-            try:
-                df = pd.read_excel(file_path)
-                merged_df = pd.concat([merged_df, df], ignore_index=True)
-            except Exception as e:
-                st.warning(f"❌ Failed to read {filename}: {e}")
-    
-    return merged_df
+from utils import df_to_parquet, df_to_xlsx
 
+# calamine parses workbooks natively; without it xlsx files are streamed read-only with openpyxl
+try:
+    import python_calamine  # noqa: F401
+    EXCEL_READ_ENGINE = "calamine"
+except ImportError:
+    EXCEL_READ_ENGINE = "openpyxl"
+
+try:
+    import libarchive
+except ImportError:  # RAR members are then read through rarfile (which runs unrar)
+    libarchive = None
+
+def open_archive(data, file_type):
+    """Open an uploaded zip/rar archive held in memory."""
+    if file_type == "rar":
+        return rarfile.RarFile(BytesIO(data), 'r')
+    return zipfile.ZipFile(BytesIO(data), 'r')
+
+def read_archive_workbooks(data, file_type, read_workbook):
+    """
+    Parse the Excel files at the top level of an uploaded archive straight from memory,
+    without extracting to disk. Members are decompressed and parsed concurrently; each
+    worker reads through its own archive handle (handles are not shared across threads).
+    Returns [(filename, (result, error))] in archive order.
+    """
+    def is_workbook(name):
+        return "/" not in name and name.endswith((".xlsx", ".xls"))
+
+    local = threading.local()
+    handles = []
+
+    if file_type == "rar" and libarchive is not None:
+        # libarchive decodes RAR in-process instead of piping each member through unrar;
+        # its entries stream in order, so they are read here and only parsed in the workers
+        with libarchive.memory_reader(data) as archive:
+            members = {e.pathname: b"".join(e.get_blocks()) for e in archive if e.isfile and is_workbook(e.pathname)}
+        filenames = list(members)
+        read_member = members.__getitem__
+    else:
+        with open_archive(data, file_type) as archive:
+            filenames = [n for n in archive.namelist() if is_workbook(n)]
+
+        def read_member(filename):
+            if not hasattr(local, "archive"):
+                local.archive = open_archive(data, file_type)
+                handles.append(local.archive)
+            return local.archive.read(filename)
+
+    def read_one(filename):
+        try:
+            source = BytesIO(read_member(filename))
+        except Exception as e:
+            return None, e
+        return read_workbook(filename, source)
+
+    try:
+        # zlib inflation and calamine parsing run without the GIL
+        with ThreadPoolExecutor(max_workers=min(len(filenames), os.cpu_count() or 1) or 1) as executor:
+            return list(zip(filenames, executor.map(read_one, filenames)))
+    finally:
+        for handle in handles:
+            handle.close()
+
+def read_xlsx_read_only(source):
+    """
+    Read the first sheet of an xlsx file, streaming plain cell values from a
+    read-only openpyxl workbook instead of building the full object graph.
+    """
+    wb = load_workbook(source, read_only=True, data_only=True)
+    try:
+        rows = wb.worksheets[0].iter_rows(values_only=True)
+        headers = next(rows, None)
+        data = list(rows)
+    finally:
+        wb.close()
+    if headers is None:
+        return pd.DataFrame()
+
+    # Match read_excel: drop trailing empty rows, name blank headers, empty cells as NaN
+    while data and all(v is None for v in data[-1]):
+        data.pop()
+    headers = [f"Unnamed: {i}" if h is None else h for i, h in enumerate(headers)]
+    return pd.DataFrame(data, columns=headers).fillna(np.nan).infer_objects()
+
+def read_excel_file(filename, source):
+    """Read the first sheet of one workbook; returns (DataFrame, None) or (None, error)."""
+    try:
+        if EXCEL_READ_ENGINE == "calamine":
+            return pd.read_excel(source, engine="calamine"), None
+        if filename.endswith(".xlsx"):
+            return read_xlsx_read_only(source), None
+        return pd.read_excel(source), None
+    except Exception as e:
+        return None, e
+
+def merge_excel_files(data, file_type):
+    frames = []
+
+    # Merged in archive order
+    for filename, (df, error) in read_archive_workbooks(data, file_type, read_excel_file):
+        if error is not None:
+            st.warning(f"❌ Failed to read {filename}: {error}")
+            continue
+        frames.append(df)
+
+    # Concatenate once instead of re-copying the merged frame for every file
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+@st.cache_data(show_spinner=False, max_entries=2)
+def merge_archive(archive_bytes, file_type):
+    """Merged frame for one uploaded archive. Cached on the archive bytes, so reruns skip parsing."""
+    return merge_excel_files(archive_bytes, file_type)
+
+@st.cache_data(show_spinner=False, max_entries=2)
+def parquet_download(archive_hash, _merged_df):
+    """
+    Parquet download for the merged frame, cached on the archive hash; returns
+    (bytes, None) or (None, error) so a frame Parquet cannot hold leaves the xlsx download.
+    """
+    try:
+        return df_to_parquet(_merged_df), None
+    except Exception as e:
+        return None, e
+
+@st.cache_data(show_spinner=False, max_entries=2)
+def xlsx_download(archive_hash, _merged_df):
+    """xlsx download for the merged frame, cached on the archive hash."""
+    return df_to_xlsx(_merged_df, 'MergedData').getvalue()
 
 # --- Streamlit UI ---
 st.set_page_config(page_title="Excel Merger", page_icon="📊")
@@ -47,38 +147,46 @@ st.title("📁 Merge Excel Files from Archive")
 
 st.markdown("""
 🔄 Upload a `.zip` or `.rar` file containing multiple Excel files with the **same headers**.
-This tool will extract and merge them into one Excel file.
+This tool will extract and merge them into one Excel file (also offered as **Parquet**).
 """)
 
 uploaded_archive = st.file_uploader("📦 Upload ZIP or RAR Folder of Excel Files", type=["zip", "rar"])
+write_xlsx = st.checkbox("Also build an Excel (.xlsx) download", value=True,
+                         help="Writing xlsx is much slower than Parquet for large merges.")
 
 if uploaded_archive is not None:
     file_type = uploaded_archive.name.split(".")[-1].lower()
 
     with st.spinner(f"Extracting and merging files from .{file_type}..."):
-        with tempfile.TemporaryDirectory() as temp_dir:
-            try:
-                extract_archive(uploaded_archive, temp_dir, file_type)
-                merged_df = merge_excel_files(temp_dir)
-            except Exception as e:
-                st.error(f"❌ Failed to process archive: {e}")
-                st.stop()
-
-            if not merged_df.empty:
-                st.success("✅ Files merged successfully!")
-                st.dataframe(merged_df.head())
-
-                # Prepare downloadable Excel
-                output = BytesIO()
-                with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-                    merged_df.to_excel(writer, index=False, sheet_name='MergedData')
-                output.seek(0)
+        try:
+            archive_bytes = uploaded_archive.getvalue()
+            merged_df = merge_archive(archive_bytes, file_type)
+            archive_hash = hashlib.md5(archive_bytes).hexdigest()
+            output = xlsx_download(archive_hash, merged_df) if write_xlsx and not merged_df.empty else None
+        except Exception as e:
+            st.error(f"❌ Failed to process archive: {e}")
+            st.stop()
 
+        if not merged_df.empty:
+            st.success("✅ Files merged successfully!")
+            st.dataframe(merged_df.head())
+
+            parquet_output, error = parquet_download(archive_hash, merged_df)
+            if error is not None:
+                st.warning(f"⚠️ Parquet not available: {error}")
+            else:
+                st.download_button(
+                    label="⬇️ Download Merged Parquet",
+                    data=parquet_output,
+                    file_name="merged_output.parquet",
+                    mime="application/vnd.apache.parquet"
+                )
+            if output is not None:
                 st.download_button(
                     label="⬇️ Download Merged Excel",
                     data=output,
                     file_name="merged_output.xlsx",
                     mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
                 )
-            else:
-                st.error("⚠️ No Excel files were found or could be processed.")
+        else:
+            st.error("⚠️ No Excel files were found or could be processed.")
@@ -0,0 +1,64 @@
+import pandas as pd
+import pyarrow as pa
+from io import BytesIO
+
+try:
+    from pyexcelerate import Alignment, Font, Format, Style, Workbook
+    from pyexcelerate.Border import Border
+    from pyexcelerate.Borders import Borders
+    HEADER_STYLE = Style(
+        font=Font(bold=True),
+        borders=Borders(left=Border(), right=Border(), top=Border(), bottom=Border()),
+        alignment=Alignment(horizontal='center', vertical='top'),
+    )
+except ImportError:  # fall back to xlsxwriter when pyexcelerate is not installed
+    Workbook = None
+    import xlsxwriter
+
+def df_to_xlsx(df, sheet_name):
+    """Write df to an in-memory xlsx file (header row, no index) and return the rewound buffer."""
+    output = BytesIO()
+    if Workbook is not None:
+        # pyexcelerate writes plain rows much faster; empty cells are passed as None
+        values = df.astype(object).where(df.notna(), None).values.tolist()
+        wb = Workbook()
+        ws = wb.new_sheet(sheet_name, data=[df.columns.tolist()] + values)
+        # Same look as pandas' writer: bordered bold header, datetime columns formatted as dates
+        for col, dtype in enumerate(df.dtypes, start=1):
+            if pd.api.types.is_datetime64_any_dtype(dtype):
+                ws.set_col_style(col, Style(format=Format('yyyy-mm-dd hh:mm:ss')))
+            ws.set_cell_style(1, col, HEADER_STYLE)
+        wb.save(output)
+    else:
+        # Row by row: constant_memory cannot take pandas' column-order writes
+        wb = xlsxwriter.Workbook(output, {
+            'constant_memory': True,
+            'default_date_format': 'yyyy-mm-dd hh:mm:ss',
+            'strings_to_urls': False,  # URL-like text stays text (hyperlinks are capped per sheet)
+        })
+        ws = wb.add_worksheet(sheet_name)
+        header_format = wb.add_format({'bold': True, 'border': 1, 'align': 'center', 'valign': 'top'})
+        ws.write_row(0, 0, df.columns.tolist(), header_format)
+        # Rows are converted in blocks so only one block of Python values is alive at a time
+        for start in range(0, len(df), 10_000):
+            block = df.iloc[start:start + 10_000]
+            for row, row_values in enumerate(block.astype(object).where(block.notna(), None).values.tolist(), start=start + 1):
+                ws.write_row(row, 0, row_values)
+        wb.close()
+    output.seek(0)
+    return output
+
+def df_to_parquet(df):
+    """Write df to in-memory Parquet bytes (zstd); unlike xlsx, no row limit applies."""
+    output = BytesIO()
+    # Parquet needs string column names and one type per column; files merged with
+    # differing cell types leave mixed object columns, which are written as text
+    df = df.rename(columns=str)
+    try:
+        df.to_parquet(output, engine='pyarrow', compression='zstd', index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        output = BytesIO()
+        df.astype({col: 'string' for col in df.select_dtypes('object').columns}).to_parquet(
+            output, engine='pyarrow', compression='zstd', index=False
+        )
+    return output.getvalue()
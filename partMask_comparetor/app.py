@@ -1,7 +1,121 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import io
 
+from utils import to_excel_bytes
+
+# calamine parses workbooks natively; openpyxl is the fallback reader
+try:
+    import python_calamine  # noqa: F401
+    EXCEL_READ_ENGINE = "calamine"
+except ImportError:
+    EXCEL_READ_ENGINE = None  # pandas' default (openpyxl for xlsx)
+
+try:
+    from numba import njit, prange
+except ImportError:  # differing characters are then packed with NumPy (argsort per row)
+    njit = None
+
+if njit is not None:
+    @njit(parallel=True)  # compiled once per server process on first use
+    def pack_diff_chars(part_arr, mask_arr, part_len, masked_len):
+        """Per row, the PartNumber code points that differ from MaskedText, moved to the front (0-padded)."""
+        packed = np.zeros_like(part_arr)
+        for i in prange(part_arr.shape[0]):
+            k = 0
+            for j in range(part_len[i]):
+                if j >= masked_len[i] or part_arr[i, j] != mask_arr[i, j]:
+                    packed[i, k] = part_arr[i, j]
+                    k += 1
+        return packed
+else:
+    pack_diff_chars = None
+
+
+@st.cache_data(show_spinner=False, max_entries=2)
+def compute_differences(file_bytes):
+    """
+    Cleaned PartNumber/MaskedText with length, diff_char and masked_code for one uploaded
+    file. Cached on the file bytes, so reruns (e.g. the download click) skip all of it.
+    """
+    df = pd.read_excel(io.BytesIO(file_bytes), engine=EXCEL_READ_ENGINE)
+
+    # Clean data: NaN -> '', text trimmed, trailing dashes dropped from MaskedText - one pass per column
+    for col, trailing in [('PartNumber', ''), ('MaskedText', '-')]:
+        if col in df.columns:
+            missing = df[col].isna().to_numpy()
+            df[col] = pd.Series(
+                ['' if m else str(v).strip().rstrip(trailing) for v, m in zip(df[col].tolist(), missing)],
+                index=df.index, dtype=object,
+            )
+
+    # Step 1: Character-level diff function, applied to whole columns at once
+    def get_diff_chars(parts, masked, part_len, masked_len):
+        """Per row, the PartNumber characters that differ from MaskedText at the same position ('no_diff' if none)."""
+        index = parts.index
+        # Fast path: when PartNumber starts with MaskedText (equal strings included), the diff is simply the rest of it
+        prefix = np.fromiter(
+            (p.startswith(m) for p, m in zip(parts.tolist(), masked.tolist())), dtype=bool, count=len(parts)
+        )
+        diff_chars = np.array(
+            [p[n:] if ok else '' for p, n, ok in zip(parts.tolist(), masked_len.tolist(), prefix)], dtype=object
+        )
+        rest = np.flatnonzero(~prefix)
+        if len(rest):
+            parts, masked, part_len, masked_len = parts.iloc[rest], masked.iloc[rest], part_len[rest], masked_len[rest]
+            width = max(part_len.max(), masked_len.max(), 1)
+            # Fixed-width code point grids, NUL-padded to a common width
+            part_arr = parts.to_numpy(dtype=f'<U{width}').view(np.uint32).reshape(len(parts), width)
+            mask_arr = masked.to_numpy(dtype=f'<U{width}').view(np.uint32).reshape(len(masked), width)
+            # Move the differing characters to the front of each row, in order, and blank the rest
+            if pack_diff_chars is not None:
+                packed = pack_diff_chars(part_arr, mask_arr, part_len, masked_len)
+            else:
+                pos = np.arange(width)
+                diff = (pos < part_len[:, None]) & ((part_arr != mask_arr) | (pos >= masked_len[:, None]))
+                order = np.argsort(~diff, axis=1, kind='stable')
+                packed = np.take_along_axis(part_arr, order, axis=1)
+                packed[pos >= diff.sum(axis=1)[:, None]] = 0
+            diff_chars[rest] = np.ascontiguousarray(packed).view(f'<U{width}').ravel()
+        return pd.Series(np.where(diff_chars == '', 'no_diff', diff_chars), index=index, dtype=object)
+
+    # Step 2: Generate diff_char and length flag (string lengths computed once for both)
+    part_len = df['PartNumber'].str.len().to_numpy()
+    masked_len = df['MaskedText'].str.len().to_numpy()
+    df['length'] = np.where(masked_len > part_len, 'lengthIssue', 'lengthApprove')
+    df['diff_char'] = get_diff_chars(df['PartNumber'], df['MaskedText'], part_len, masked_len)
+
+    # Step 3: Optional masked_code reconstruction from known suffix patterns
+    df['masked_code'] = ''
+    suffixes_by_len = {}
+    for suffix_item in df.loc[df['diff_char'] != 'no_diff', 'diff_char'].dropna().unique():
+        if suffix_item:
+            suffixes_by_len.setdefault(len(suffix_item), set()).add(suffix_item)
+
+    # A part number ends with at most one suffix of each length, so checking the still unmatched
+    # rows' tails once per length (longest first) picks the same suffix as testing every suffix
+    part_numbers = np.asarray(df['PartNumber'].tolist(), dtype=object)
+    todo = np.flatnonzero((df['diff_char'] == 'no_diff').to_numpy())
+    matched_rows, matched_len = [], []
+    for length in sorted(suffixes_by_len, reverse=True):
+        hit = np.fromiter(
+            (p[-length:] in suffixes_by_len[length] for p in part_numbers[todo]), dtype=bool, count=len(todo)
+        )
+        matched_rows.append(todo[hit])
+        matched_len += [length] * int(hit.sum())
+        todo = todo[~hit]
+
+    # One write per column for every matched row: masked_code is the part before the suffix
+    if matched_len:
+        rows = np.concatenate(matched_rows)
+        codes, suffixes = zip(*((p[:-n], p[-n:]) for p, n in zip(part_numbers[rows], matched_len)))
+        df.iloc[rows, df.columns.get_loc('masked_code')] = list(codes)
+        df.iloc[rows, df.columns.get_loc('diff_char')] = list(suffixes)
+
+    return df
+
+
 st.set_page_config(page_title="Part Number Difference Tool", layout="wide")
 st.title("🔍 Exact Character-by-Character Difference Tool")
 
@@ -9,57 +123,15 @@ uploaded_file = st.file_uploader("📤 Upload Excel file with PartNumber and Mas
 
 if uploaded_file:
     try:
-        df = pd.read_excel(uploaded_file)
+        df = compute_differences(uploaded_file.getvalue())
         st.success(f"✅ File loaded with {len(df)} rows.")
 
-        # Clean data
-        for col in ['PartNumber', 'MaskedText']:
-            if col in df.columns:
-                df[col] = df[col].fillna('').astype(str).str.strip()
-        df['MaskedText'] = df['MaskedText'].str.rstrip('-')
-
-        # Step 1: Character-level diff function
-        def get_diff_chars(part, masked):
-            diff = ''
-            max_len = max(len(part), len(masked))
-            for i in range(max_len):
-                p_char = part[i] if i < len(part) else ''
-                m_char = masked[i] if i < len(masked) else ''
-                if p_char != m_char:
-                    diff += p_char
-            return diff if diff else 'no_diff'
-
-        # Step 2: Generate diff_char and length flag
-        df['length'] = df.apply(
-            lambda row: 'lengthIssue' if len(row['MaskedText']) > len(row['PartNumber']) else 'lengthApprove',
-            axis=1
-        )
-        df['diff_char'] = df.apply(
-            lambda row: get_diff_chars(row['PartNumber'], row['MaskedText']),
-            axis=1
-        )
-
-        # Step 3: Optional masked_code reconstruction from known suffix patterns
-        df['masked_code'] = ''
-        suffix_list = df.loc[df['diff_char'] != 'no_diff', 'diff_char'].dropna().unique().tolist()
-        suffix_list = sorted(suffix_list, key=len, reverse=True)  # longest first
-
-        for suffix_item in suffix_list:
-            if suffix_item:
-                mask = (df['diff_char'] == 'no_diff') & (df['PartNumber'].str.endswith(suffix_item, na=False))
-                if mask.any():
-                    df.loc[mask, 'masked_code'] = df.loc[mask, 'PartNumber'].str[:-len(suffix_item)]
-                    df.loc[mask, 'diff_char'] = suffix_item  # update diff_char with matched suffix
-
         # Show preview
         st.subheader("📋 Differences Found")
-        st.dataframe(df[['PartNumber', 'MaskedText', 'length', 'diff_char', 'masked_code']].head(20))
+        st.dataframe(df.head(20)[['PartNumber', 'MaskedText', 'length', 'diff_char', 'masked_code']])
 
         # Download results
-        to_download = io.BytesIO()
-        df.to_excel(to_download, index=False)
-        to_download.seek(0)
-        st.download_button("📥 Download Results", to_download, file_name="part_diff_output.xlsx")
+        st.download_button("📥 Download Results", to_excel_bytes(df), file_name="part_diff_output.xlsx")
 
     except Exception as e:
         st.error(f"❌ Error processing file: {e}")
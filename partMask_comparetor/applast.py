@@ -1,7 +1,77 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import io
 
+from utils import to_excel_bytes
+
+# calamine parses workbooks natively; openpyxl is the fallback reader
+try:
+    import python_calamine  # noqa: F401
+    EXCEL_READ_ENGINE = "calamine"
+except ImportError:
+    EXCEL_READ_ENGINE = None  # pandas' default (openpyxl for xlsx)
+
+
+@st.cache_data(show_spinner=False, max_entries=2)
+def compute_masking(file_bytes):
+    """
+    Cleaned PartNumber/MaskedText with suffix_value and masked_code for one uploaded
+    file. Cached on the file bytes, so reruns (e.g. the download click) skip all of it.
+    """
+    # Load Excel file into DataFrame
+    df = pd.read_excel(io.BytesIO(file_bytes), engine=EXCEL_READ_ENGINE)
+
+    # Clean and preprocess: NaN -> '', text trimmed, trailing dashes dropped from MaskedText - one pass per column
+    for col, trailing in [('PartNumber', ''), ('MaskedText', '-')]:
+        if col in df.columns:
+            missing = df[col].isna().to_numpy()
+            df[col] = pd.Series(
+                ['' if m else str(v).strip().rstrip(trailing) for v, m in zip(df[col].tolist(), missing)],
+                index=df.index, dtype=object,
+            )
+
+    # Step 1: Suffix extraction (the part after the first occurrence of MaskedText), over plain lists
+    df['length'] = np.where(
+        df['MaskedText'].str.len() > df['PartNumber'].str.len(), 'lengthIssue', 'lengthApprove'
+    )
+    suffix_values = []
+    for part_number, masked_text in zip(df['PartNumber'].tolist(), df['MaskedText'].tolist()):
+        pos = part_number.find(masked_text)  # 0 when part_number starts with masked_text
+        diff_value = part_number[pos + len(masked_text):] if pos >= 0 else 'no_diff'
+        suffix_values.append(diff_value if diff_value else 'no_diff')
+    df['suffix_value'] = suffix_values
+
+    # Step 2: Generate masked_code
+    df['masked_code'] = ''
+    suffixes_by_len = {}
+    for suffix_item in df.loc[df['suffix_value'] != 'no_diff', 'suffix_value'].dropna().unique():
+        if suffix_item:
+            suffixes_by_len.setdefault(len(suffix_item), set()).add(suffix_item)
+
+    # A part number ends with at most one suffix of each length, so checking the still unmatched
+    # rows' tails once per length (longest first) picks the same suffix as testing every suffix
+    part_numbers = np.asarray(df['PartNumber'].tolist(), dtype=object)
+    todo = np.flatnonzero((df['suffix_value'] == 'no_diff').to_numpy())
+    matched_rows, matched_len = [], []
+    for length in sorted(suffixes_by_len, reverse=True):
+        hit = np.fromiter(
+            (p[-length:] in suffixes_by_len[length] for p in part_numbers[todo]), dtype=bool, count=len(todo)
+        )
+        matched_rows.append(todo[hit])
+        matched_len += [length] * int(hit.sum())
+        todo = todo[~hit]
+
+    # One write per column for every matched row: masked_code is the part before the suffix
+    if matched_len:
+        rows = np.concatenate(matched_rows)
+        codes, suffixes = zip(*((p[:-n], p[-n:]) for p, n in zip(part_numbers[rows], matched_len)))
+        df.iloc[rows, df.columns.get_loc('masked_code')] = list(codes)
+        df.iloc[rows, df.columns.get_loc('suffix_value')] = list(suffixes)
+
+    return df
+
+
 st.set_page_config(page_title="Part Number Masking Tool", layout="wide")
 st.title("🔧 Part Number Masking Tool")
 
@@ -10,59 +80,15 @@ uploaded_file = st.file_uploader("📤 Upload Excel file with PartNumber and Mas
 
 if uploaded_file:
     try:
-        # Load Excel file into DataFrame
-        df = pd.read_excel(uploaded_file)
+        df = compute_masking(uploaded_file.getvalue())
         st.success(f"✅ File loaded with {len(df)} rows.")
 
-        # Clean and preprocess
-        for col in ['PartNumber', 'MaskedText']:
-            if col in df.columns:
-                df[col] = df[col].fillna('').astype(str).str.strip()
-
-        if 'MaskedText' in df.columns:
-            df['MaskedText'] = df['MaskedText'].str.rstrip('-')
-
-        # Step 1: Suffix extraction
-        for index, row in df.iterrows():
-            part_number = row['PartNumber']
-            masked_text = row['MaskedText']
-
-            if len(masked_text) > len(part_number):
-                df.at[index, 'length'] = 'lengthIssue'
-            else:
-                df.at[index, 'length'] = 'lengthApprove'
-
-            if part_number.startswith(masked_text):
-                diff_value = part_number[len(masked_text):]
-            elif masked_text in part_number:
-                pos = part_number.find(masked_text)
-                diff_value = part_number[pos + len(masked_text):]
-            else:
-                diff_value = 'no_diff'
-
-            df.at[index, 'suffix_value'] = diff_value if diff_value else 'no_diff'
-
-        # Step 2: Generate masked_code
-        df['masked_code'] = ''
-        suffix_list = df.loc[df['suffix_value'] != 'no_diff', 'suffix_value'].unique().tolist()
-        suffix_list.sort(key=len, reverse=True)
-
-        for suffix_item in suffix_list:
-            if pd.notna(suffix_item) and suffix_item != '':
-                mask = (df['suffix_value'] == 'no_diff') & (df['PartNumber'].str.endswith(suffix_item, na=False))
-                if mask.any():
-                    df.loc[mask, 'masked_code'] = df.loc[mask, 'PartNumber'].str[:-len(suffix_item)]
-                    df.loc[mask, 'suffix_value'] = suffix_item
-
         # Show preview
         st.subheader("📋 Preview of Processed Data")
-        st.dataframe(df[['PartNumber', 'MaskedText', 'suffix_value', 'masked_code']].head())
+        st.dataframe(df.head()[['PartNumber', 'MaskedText', 'suffix_value', 'masked_code']])
 
         # Download processed file
-        to_download = io.BytesIO()
-        df.to_excel(to_download, index=False)
-        to_download.seek(0)
-        st.download_button("📥 Download Processed File", to_download, file_name="masked_output.xlsx")
+        st.download_button("📥 Download Processed File", to_excel_bytes(df), file_name="masked_output.xlsx")
 
     except Exception as e:
         st.error(f"❌ Error processing file: {e}")
@@ -0,0 +1,26 @@
+import io
+import streamlit as st
+import xlsxwriter
+
+
+@st.cache_data(show_spinner=False, max_entries=2)
+def to_excel_bytes(df):
+    """Write df to an in-memory xlsx file (header row, no index) for download."""
+    output = io.BytesIO()
+    # constant_memory streams each row out as it is written; pandas' writer fills the sheet
+    # column by column, which that mode cannot take, so rows are written here directly
+    wb = xlsxwriter.Workbook(output, {
+        'constant_memory': True,
+        'default_date_format': 'yyyy-mm-dd hh:mm:ss',
+        'strings_to_urls': False,  # URL-like text stays text (hyperlinks are capped per sheet)
+    })
+    ws = wb.add_worksheet('Sheet1')
+    header_format = wb.add_format({'bold': True, 'border': 1, 'align': 'center', 'valign': 'top'})
+    ws.write_row(0, 0, df.columns.tolist(), header_format)
+    # Rows are converted in blocks so only one block of Python values is alive at a time
+    for start in range(0, len(df), 10_000):
+        block = df.iloc[start:start + 10_000]
+        for row, row_values in enumerate(block.astype(object).where(block.notna(), None).values.tolist(), start=start + 1):
+            ws.write_row(row, 0, row_values)
+    wb.close()
+    return output.getvalue()
@@ -1,11 +1,26 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import re
 import io
+import xlsxwriter
 from datetime import datetime
 
+# calamine parses workbooks natively; openpyxl is the fallback reader
+try:
+    import python_calamine  # noqa: F401
+    EXCEL_READ_ENGINE = "calamine"
+except ImportError:
+    EXCEL_READ_ENGINE = None  # pandas' default (openpyxl for xlsx)
 
-def normalize_pin_group(pin: str) -> str:
+
+NON_PIN_CHARS_RE = re.compile(r'[^A-Z#-]')  # digits and anything else but letters, '#' and '-'
+NON_LETTERS_RE = re.compile(r'[^A-Z]')
+PARQUET_MIN_ROWS = 100_000  # above this, a Parquet download is offered next to the xlsx one
+STATUSES = ["seems Ok", "Conflict in same PL | Pin name", "Case Sensitive Different"]  # Status categories
+
+
+def normalize_pin_groups(pins: pd.Series) -> pd.Series:
     """
     Normalize pin names into logical groups.
     Removes digits, keeps letters, '-', and '#'.
@@ -13,36 +28,24 @@ def normalize_pin_group(pin: str) -> str:
     - Any word with '-' at start OR end becomes "-WORD-" 
     - Any word with '#' at start OR end becomes "#WORD#"
     - Words with both '-' and '#' prioritize '#'
+    Works on the whole column: each distinct pin name is normalized once with
+    Series.str operations and the results are mapped back to every row.
     """
-    pin = str(pin).upper().strip()
-    
-    # Remove digits first
-    pin_no_digits = re.sub(r'\d', '', pin)
-    
-    # Keep only letters, #, and -
-    clean_pin = re.sub(r'[^A-Z#-]', '', pin_no_digits)
-    
-    if not clean_pin:
-        return clean_pin
-    
+    codes, uniques = pd.factorize(pins, use_na_sentinel=False)
+    pin = pd.Series(uniques, dtype=object).astype(str).str.upper().str.strip()
+
+    # Keep only letters, #, and - (digits removed)
+    clean_pin = pin.str.replace(NON_PIN_CHARS_RE, '', regex=True)
     # Extract all letters (the core words)
-    letters_only = re.sub(r'[^A-Z]', '', clean_pin)
-    
-    if not letters_only:
-        return clean_pin
-    
-    # Check for presence of delimiters
-    has_dash = '-' in clean_pin
-    has_hash = '#' in clean_pin
-    
-    # If both delimiters exist, prioritize # over -
-    if has_hash:
-        return f'#{letters_only}'
-    elif has_dash:
-        return f'-{letters_only}'
-    else:
-        # No delimiters, just return the letters
-        return letters_only
+    letters_only = clean_pin.str.replace(NON_LETTERS_RE, '', regex=True)
+
+    # No letters: keep the cleaned pin as is; otherwise # wins over -, and no delimiter gives the letters
+    groups = np.select(
+        [letters_only == '', clean_pin.str.contains('#', regex=False), clean_pin.str.contains('-', regex=False)],
+        [clean_pin, '#' + letters_only, '-' + letters_only],
+        letters_only,
+    )
+    return pd.Series(groups[codes], index=pins.index, dtype=object)
 
 
 # def normalize_pin_group(pin: str) -> str:
@@ -74,34 +77,34 @@ def process_excel(df):
     # Ensure 'PartsCount' is numeric
     df['PartsCount'] = pd.to_numeric(df['PartsCount'], errors='coerce')
     df = df.dropna(subset=['PartsCount'])  # Drop rows where conversion failed
+    # Whole counts are stored in the smallest integer type that holds them (sums still come out int64)
+    df['PartsCount'] = pd.to_numeric(df['PartsCount'], downcast='integer')
 
     # Create PinGroup column for grouping, but keep original Pin Name intact
-    df["PinGroup"] = df["Pin Name"].apply(normalize_pin_group)
+    df["PinGroup"] = normalize_pin_groups(df["Pin Name"])
+
+    # Group keys as categories, so the groupbys here and in the summary work on integer codes
+    # (observed=True keeps them to the combinations that actually occur, like plain strings)
+    df["DataDefinition"] = df["DataDefinition"].astype("category")
+    df["PinGroup"] = df["PinGroup"].astype("category")
+
+    # Group stats are written straight back to the rows with transform (no side tables to merge)
+    final_df = df.reset_index(drop=True)
 
     # ---- EXACT GROUP (DataDefinition + Pin Name) ----
     # Use original Pin Name column, not modified version
-    exact_stats = (
-        df.groupby(["DataDefinition", "Pin Name"], dropna=False)["Normalized Pin NAME"]
-        .agg(["nunique", lambda x: len(set(x)) > 1])
-        .reset_index()
-        .rename(columns={"nunique": "CountExact", "<lambda_0>": "DiffExact"})
+    final_df["CountExact"] = (
+        final_df.groupby(["DataDefinition", "Pin Name"], dropna=False, observed=True)["Normalized Pin NAME"]
+        .transform("nunique")
     )
+    final_df["DiffExact"] = final_df["CountExact"] > 1
 
     # ---- SIMILARITY GROUP (DataDefinition + PinGroup) ----
-    sim_stats = (
-        df.groupby(["DataDefinition", "PinGroup"], dropna=False)["Normalized Pin NAME"]
-        .agg(["nunique", lambda x: len(set(x)) > 1])
-        .reset_index()
-        .rename(columns={"nunique": "CountSim", "<lambda_0>": "DiffSim"})
+    final_df["CountSim"] = (
+        final_df.groupby(["DataDefinition", "PinGroup"], dropna=False, observed=True)["Normalized Pin NAME"]
+        .transform("nunique")
     )
-
-    # ---- Merge back to main ----
-    final_df = df.merge(exact_stats,
-                        on=["DataDefinition", "Pin Name"],
-                        how="left")
-    final_df = final_df.merge(sim_stats,
-                              on=["DataDefinition", "PinGroup"],
-                              how="left")
+    final_df["DiffSim"] = final_df["CountSim"] > 1
 
     return final_df
 
@@ -115,37 +118,74 @@ def summarize_all_normalized(df_proc):
     df_proc['PartsCount'] = pd.to_numeric(df_proc['PartsCount'], errors='coerce').fillna(0)
 
     # For calculations, normalize case but don't modify original data
-    df_proc["Norm_lower"] = df_proc["Normalized Pin NAME"].astype(str).str.upper()
-
-    results = []
-
-    # Loop by DataDefinition + PinGroup
-    for (dd, pg), group_pg in df_proc.groupby(["DataDefinition", "PinGroup"]):
-        norm_sums = group_pg.groupby("Norm_lower")["PartsCount"].sum()
-        total = norm_sums.sum()
-        max_norm = norm_sums.idxmax() if not norm_sums.empty else None
-
-        for norm_lower, cnt in norm_sums.items():
-            perc = (cnt / total * 100) if total > 0 else 0
-            # Find the first original Normalized Pin NAME for this group
-            original_name_series = group_pg.loc[group_pg["Norm_lower"] == norm_lower, "Normalized Pin NAME"]
-            original_name = original_name_series.iloc[0] if not original_name_series.empty else "Unknown"
-
-            status = "seems Ok" if norm_lower == max_norm else "Conflict in same PL | Pin name"
-
-            results.append({
-                "DataDefinition": dd,
-                "SumCountExact": total,
-                "PinGroup": pg,
-                "Normalized Pin NAME": original_name,
-                "Percentage": round(perc, 2),
-                "PartsCount": cnt,
-                "Status": status
-            })
+    # (each distinct name is uppercased once and mapped back to its rows)
+    codes, uniques = pd.factorize(df_proc["Normalized Pin NAME"], use_na_sentinel=False)
+    df_proc["Norm_lower"] = pd.Series(uniques, dtype=object).astype(str).str.upper().to_numpy()[codes]
 
-    summary_df = pd.DataFrame(results)
+    keys = ["DataDefinition", "PinGroup"]
+
+    # PartsCount and the first original spelling per Normalized Pin NAME (case-insensitive) within
+    # each DataDefinition + PinGroup, in the same sorted order the per-group loop produced
+    norm_sums = df_proc.groupby(keys + ["Norm_lower"], as_index=False, observed=True).agg(
+        PartsCount=("PartsCount", "sum"), original_name=("Normalized Pin NAME", "first")
+    )
+    by_group = norm_sums.groupby(keys, observed=True)["PartsCount"]
+    total = by_group.transform("sum")
+    perc = (norm_sums["PartsCount"] / total * 100).where(total > 0, 0)
+    # Only the first Normalized Pin NAME with the largest count (idxmax) is the dominant one
+    is_max = norm_sums.index == by_group.transform("idxmax")
+
+    summary_df = pd.DataFrame({
+        "DataDefinition": norm_sums["DataDefinition"],
+        "SumCountExact": total,
+        "PinGroup": norm_sums["PinGroup"],
+        "Normalized Pin NAME": norm_sums["original_name"],
+        "Percentage": [round(p, 2) for p in perc.tolist()],
+        "PartsCount": norm_sums["PartsCount"],
+        "Status": pd.Categorical(np.where(is_max, "seems Ok", "Conflict in same PL | Pin name"), categories=STATUSES),
+    })
     return summary_df
 
+@st.cache_data(show_spinner=False, max_entries=2)
+def read_pin_file(file_bytes):
+    """Read an uploaded pin file as text (blank cells kept as ''); cached on the file bytes"""
+    df = pd.read_excel(io.BytesIO(file_bytes), dtype=str, keep_default_na=False, engine=EXCEL_READ_ENGINE)
+    # Back the text columns with Arrow strings so the string, factorize and groupby
+    # work runs over Arrow buffers instead of Python str objects
+    text_columns = [col for col in ["DataDefinition", "Pin Name", "Normalized Pin NAME"] if col in df.columns]
+    df[text_columns] = df[text_columns].astype("string[pyarrow]")
+    return df
+
+@st.cache_data(show_spinner=False, max_entries=2)
+def analyze_pin_file(file_bytes):
+    """
+    Processed data (with Percentage and Status) and summary for one uploaded file.
+    Cached on the file bytes, so reruns (option toggles, download clicks) skip the groupbys.
+    """
+    processed_df = process_excel(read_pin_file(file_bytes))
+    summary_df = summarize_all_normalized(processed_df)
+
+    # Update main dataframe with status and percentage
+    merged_df = processed_df.merge(
+        summary_df[["DataDefinition", "PinGroup", "Normalized Pin NAME", "Percentage", "Status"]],
+        on=["DataDefinition", "PinGroup", "Normalized Pin NAME"],
+        how="left"
+    )
+    merged_df["Status"] = merged_df["Status"].fillna("Case Sensitive Different")
+    return merged_df, summary_df
+
+def session_memo(name, key, compute):
+    """
+    Return the result kept in session state under name if it was computed for the same key,
+    otherwise compute it and keep it there, so option toggles reuse it without any copying.
+    """
+    kept = st.session_state.get(name)
+    if kept is not None and kept[0] == key:
+        return kept[1]
+    result = compute()
+    st.session_state[name] = (key, result)
+    return result
+
 def create_template():
     """Create a template Excel file for users to download"""
     template_data = {
@@ -182,11 +222,32 @@ def create_template():
     template_df = pd.DataFrame(template_data)
     return template_df
 
+@st.cache_data(show_spinner=False, max_entries=8)
 def to_excel_bytes(df, sheet_name="Sheet1"):
     """Convert dataframe to Excel bytes for download"""
     output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, sheet_name=sheet_name, index=False)
+    # Row by row: constant_memory cannot take pandas' column-order writes
+    wb = xlsxwriter.Workbook(output, {
+        'constant_memory': True,
+        'default_date_format': 'yyyy-mm-dd hh:mm:ss',
+        'strings_to_urls': False,  # URL-like text stays text (hyperlinks are capped per sheet)
+    })
+    ws = wb.add_worksheet(sheet_name)
+    header_format = wb.add_format({'bold': True, 'border': 1, 'align': 'center', 'valign': 'top'})
+    ws.write_row(0, 0, df.columns.tolist(), header_format)
+    # Rows are converted in blocks so only one block of Python values is alive at a time
+    for start in range(0, len(df), 10_000):
+        block = df.iloc[start:start + 10_000]
+        for row, row_values in enumerate(block.astype(object).where(block.notna(), None).values.tolist(), start=start + 1):
+            ws.write_row(row, 0, row_values)
+    wb.close()
+    return output.getvalue()
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def to_parquet_bytes(df):
+    """Convert dataframe to zstd Parquet bytes for download (much faster than xlsx for large frames)"""
+    output = io.BytesIO()
+    df.to_parquet(output, engine='pyarrow', compression='zstd', index=False)
     return output.getvalue()
 
 # Streamlit App
@@ -218,8 +279,9 @@ def main():
 
         if uploaded_file is not None:
             try:
-                # Load the uploaded file
-                df = pd.read_excel(uploaded_file, dtype=str, keep_default_na=False)
+                # Load the uploaded file (parsed once per upload; option toggles reuse the session's copy)
+                file_key = (uploaded_file.file_id, uploaded_file.name, uploaded_file.size)
+                df = session_memo("pin_file", file_key, lambda: read_pin_file(uploaded_file.getvalue()))
                 
                 # Validate required columns
                 required_columns = ["DataDefinition", "Pin Name", "Normalized Pin NAME", "PartsCount"]
@@ -229,7 +291,7 @@ def main():
                     st.error(f"Missing required columns: {', '.join(missing_columns)}")
                     st.info("Please use the template file format from the Template tab.")
                     return
-                
+
                 st.success(f"✅ File uploaded successfully! Found {len(df)} rows.")
                 
                 if show_preview:
@@ -238,18 +300,14 @@ def main():
                 
                 # Process the data
                 with st.spinner("Processing data..."):
-                    processed_df = process_excel(df)
-                    summary_df = summarize_all_normalized(processed_df)
-                
-                # Update main dataframe with status and percentage
-                merged_df = processed_df.merge(
-                    summary_df[["DataDefinition", "PinGroup", "Normalized Pin NAME", "Percentage", "Status"]],
-                    on=["DataDefinition", "PinGroup", "Normalized Pin NAME"],
-                    how="left"
-                )
-                merged_df["Status"] = merged_df["Status"].fillna("Case Sensitive Different")
+                    merged_df, summary_df = session_memo(
+                        "pin_results", file_key, lambda: analyze_pin_file(uploaded_file.getvalue())
+                    )
                 
                 st.success("✅ Processing completed!")
+
+                # Conflict rows, found once for the metric and the Conflicts tab
+                is_conflict = (merged_df["Status"] == "Conflict in same PL | Pin name").to_numpy()
                 
                 # Show statistics
                 if show_statistics:
@@ -263,8 +321,7 @@ def main():
                     with col3:
                         st.metric("Unique Pin Groups", merged_df["PinGroup"].nunique())
                     with col4:
-                        conflicts = (merged_df["Status"] == "Conflict in same PL | Pin name").sum()
-                        st.metric("Conflicts Detected", conflicts)
+                        st.metric("Conflicts Detected", int(is_conflict.sum()))
                 
                 # Display results in tabs
                 tab1a, tab2a, tab3a = st.tabs(["📋 Processed Data", "📊 Summary", "⚠️ Conflicts"])
@@ -281,6 +338,13 @@ def main():
                         file_name=f"processed_pin_data_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx",
                         mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
                     )
+                    if len(merged_df) > PARQUET_MIN_ROWS:
+                        st.download_button(
+                            label="📥 Download Processed Data (Parquet)",
+                            data=to_parquet_bytes(merged_df),
+                            file_name=f"processed_pin_data_{datetime.now().strftime('%Y%m%d_%H%M%S')}.parquet",
+                            mime="application/vnd.apache.parquet"
+                        )
                 
                 with tab2a:
                     st.subheader("Summary by Pin Groups")
@@ -294,10 +358,17 @@ def main():
                         file_name=f"pin_summary_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx",
                         mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
                     )
+                    if len(summary_df) > PARQUET_MIN_ROWS:
+                        st.download_button(
+                            label="📥 Download Summary (Parquet)",
+                            data=to_parquet_bytes(summary_df),
+                            file_name=f"pin_summary_{datetime.now().strftime('%Y%m%d_%H%M%S')}.parquet",
+                            mime="application/vnd.apache.parquet"
+                        )
                 
                 with tab3a:
                     st.subheader("Detected Conflicts")
-                    conflicts_df = merged_df[merged_df["Status"] == "Conflict in same PL | Pin name"]
+                    conflicts_df = merged_df[is_conflict]
                     
                     if len(conflicts_df) > 0:
                         st.warning(f"Found {len(conflicts_df)} rows with conflicts")
@@ -305,7 +376,7 @@ def main():
                         
                         # Show conflict summary
                         st.subheader("Conflict Summary by DataDefinition")
-                        conflict_summary = conflicts_df.groupby("DataDefinition").agg({
+                        conflict_summary = conflicts_df.groupby("DataDefinition", observed=True).agg({
                             "Pin Name": "count",
                             "PinGroup": "nunique"
                         }).rename(columns={"Pin Name": "Conflict_Count", "PinGroup": "Affected_Groups"})
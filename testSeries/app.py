@@ -1,12 +1,43 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 from difflib import SequenceMatcher
-from collections import defaultdict
-import re
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import io
 import base64
+import hashlib
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from openpyxl import load_workbook
+
+try:
+    from rapidfuzz import fuzz, process
+except ImportError:  # fall back to difflib when rapidfuzz is not installed
+    fuzz = process = None
+try:
+    import polars as pl
+except ImportError:  # pandas handles the grouped string joins when polars is not installed
+    pl = None
+try:
+    from numba import njit, prange
+except ImportError:  # the difflib fallback runs in pure Python when numba is not installed
+    njit = None
+
+# Upload/master reads and download writes; openpyxl covers whichever is missing
+try:
+    import python_calamine  # noqa: F401
+    EXCEL_READ_ENGINE = 'calamine'
+except ImportError:
+    EXCEL_READ_ENGINE = 'openpyxl'
+try:
+    import xlsxwriter  # noqa: F401
+    EXCEL_WRITE_ENGINE = 'xlsxwriter'
+except ImportError:
+    EXCEL_WRITE_ENGINE = 'openpyxl'
 
 # Configuration
 MASTER_URL = "https://raw.githubusercontent.com/AbdallahHesham44/Series_2/refs/heads/main/MasterSeriesHistory.xlsx"
@@ -20,14 +51,55 @@ BRANCH            = "main"
 MASTER_FILE_PATH  = "MasterSeriesHistory.xlsx"
 RULES_FILE_PATH   = "SampleSeriesRules.xlsx"
 
+# Local copies of downloaded files, revalidated with the server's ETag
+DOWNLOAD_CACHE_DIR = os.path.join(tempfile.gettempdir(), "z2tools_cache")
+
 # ──────────────────────────────────────────────────────────────────────────────
 # NEW: helpers for pushing to GitHub (replace old update_github_file)
 # ──────────────────────────────────────────────────────────────────────────────
 def df_to_xlsx_bytes(df: pd.DataFrame) -> bytes:
     buf = io.BytesIO()
-    df.to_excel(buf, index=False, engine='openpyxl')
+    # xlsxwriter would turn DataSheetURL values into hyperlinks (capped per sheet); keep them as text
+    engine_kwargs = {'options': {'strings_to_urls': False}} if EXCEL_WRITE_ENGINE == 'xlsxwriter' else {}
+    with pd.ExcelWriter(buf, engine=EXCEL_WRITE_ENGINE, engine_kwargs=engine_kwargs) as writer:
+        df.to_excel(writer, index=False)
     return buf.getvalue()
 
+@st.cache_resource
+def _http_session():
+    """
+    One requests session shared across reruns, so GitHub calls reuse keep-alive
+    connections instead of a new TLS handshake per request. Idempotent GETs
+    retry transient server errors.
+    """
+    session = requests.Session()
+    retry = Retry(total=3, backoff_factor=0.5, status_forcelist=(502, 503, 504), allowed_methods=frozenset({"GET"}))
+    session.mount("https://", HTTPAdapter(max_retries=retry))
+    return session
+
+def _get_remote_sha(file_path: str, headers: dict):
+    """
+    Look up the blob SHA of file_path on BRANCH without downloading the file.
+    The parent directory listing carries each entry's SHA but no base64 content,
+    so this stays cheap however large the workbook grows.
+    Returns: (sha or None if the file does not exist, error message or None)
+    """
+    parent = file_path.rpartition("/")[0]
+    url = f"{GITHUB_API_BASE}/repos/{REPO_OWNER}/{REPO_NAME}/contents"
+    if parent:
+        url += f"/{parent}"
+
+    r = _http_session().get(url, headers=headers, params={"ref": BRANCH})
+    if r.status_code == 404:
+        return None, None
+    if r.status_code != 200:
+        return None, f"Failed to read file: {r.status_code} – {r.text}"
+
+    for entry in r.json():
+        if entry.get("path") == file_path:
+            return entry.get("sha"), None
+    return None, None
+
 def update_github_bytes(file_bytes: bytes, file_path: str, commit_message: str, github_token: str):
     """
     Create or update a file in GitHub using the Contents API.
@@ -43,12 +115,9 @@ def update_github_bytes(file_bytes: bytes, file_path: str, commit_message: str,
         url = f"{GITHUB_API_BASE}/repos/{REPO_OWNER}/{REPO_NAME}/contents/{file_path}"
 
         # Get current SHA if file exists
-        sha = None
-        get_r = requests.get(url, headers=headers)
-        if get_r.status_code == 200:
-            sha = get_r.json().get("sha")
-        elif get_r.status_code not in (200, 404):
-            return False, f"Failed to read file: {get_r.status_code} – {get_r.text}"
+        sha, error = _get_remote_sha(file_path, headers)
+        if error:
+            return False, error
 
         payload = {
             "message": commit_message,
@@ -59,7 +128,7 @@ def update_github_bytes(file_bytes: bytes, file_path: str, commit_message: str,
         if sha:
             payload["sha"] = sha
 
-        put_r = requests.put(url, headers=headers, json=payload)
+        put_r = _http_session().put(url, headers=headers, json=payload)
         if put_r.status_code in (200, 201):
             return True, "File pushed to GitHub successfully."
         else:
@@ -95,24 +164,271 @@ def _apply_repo_config_from_secrets():
         pass
 # ──────────────────────────────────────────────────────────────────────────────
 
-def load_file_from_github(url):
-    """Load Excel file from GitHub URL."""
+def _fetch_bytes(url, session=requests):
+    """Download a file, revalidating the cached copy with its ETag (reused on 304 Not Modified)."""
+    # ETag line and content are kept in one file, replaced in one step, so they always match
+    cache_path = os.path.join(DOWNLOAD_CACHE_DIR, hashlib.md5(url.encode()).hexdigest() + ".etag-cache")
+    cached = None
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-        return pd.read_excel(io.BytesIO(response.content), engine='openpyxl')
-    except Exception as e:
-        st.error(f"Error loading file from {url}: {e}")
+        with open(cache_path, "rb") as f:
+            etag, _, content = f.read().partition(b"\n")
+        cached = (etag.decode(), content)
+    except OSError:
+        pass
+
+    headers = {"If-None-Match": cached[0]} if cached else {}
+    response = session.get(url, headers=headers)
+    if response.status_code == 304 and cached:
+        return cached[1]
+    response.raise_for_status()
+
+    etag = response.headers.get("ETag")
+    if etag:
+        try:
+            os.makedirs(DOWNLOAD_CACHE_DIR, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=DOWNLOAD_CACHE_DIR)
+            with os.fdopen(fd, "wb") as f:
+                f.write(etag.encode() + b"\n" + response.content)
+            os.replace(tmp_path, cache_path)
+        except OSError:
+            pass  # the cache is only an optimization
+    return response.content
+
+def _file_hash(file_bytes: bytes) -> str:
+    return hashlib.md5(file_bytes).hexdigest()
+
+def _frame_token(df):
+    """
+    Cheap cache token for a DataFrame: the hash of the file it was parsed from,
+    falling back to hashing its contents for frames built in memory.
+    """
+    if df is None:
         return None
+    token = df.attrs.get('content_hash')
+    if token is None:
+        token = hashlib.md5(pd.util.hash_pandas_object(df, index=True).values.tobytes()).hexdigest()
+    return token
+
+def read_excel_bytes(file_bytes: bytes) -> pd.DataFrame:
+    """
+    Read the first sheet of an xlsx file. Uses calamine when installed; otherwise
+    streams plain cell values from a read-only openpyxl workbook.
+    """
+    if EXCEL_READ_ENGINE == 'calamine':
+        df = pd.read_excel(io.BytesIO(file_bytes), engine='calamine')
+        df.attrs['content_hash'] = _file_hash(file_bytes)
+        return df
+
+    wb = load_workbook(io.BytesIO(file_bytes), read_only=True, data_only=True)
+    try:
+        rows = wb.worksheets[0].iter_rows(values_only=True)
+        headers = next(rows, None)
+        data = list(rows)
+    finally:
+        wb.close()
+    if headers is None:
+        df = pd.DataFrame()
+        df.attrs['content_hash'] = _file_hash(file_bytes)
+        return df
+
+    # Match read_excel: drop trailing empty rows, name blank headers, empty cells as NaN
+    while data and all(v is None for v in data[-1]):
+        data.pop()
+    headers = [f"Unnamed: {i}" if h is None else h for i, h in enumerate(headers)]
+    df = pd.DataFrame(data, columns=headers).fillna(np.nan).infer_objects()
+    df.attrs['content_hash'] = _file_hash(file_bytes)
+    return df
+
+def _fetch_excel(url, session=requests):
+    return read_excel_bytes(_fetch_bytes(url, session))
+
+@st.cache_data(show_spinner=False, ttl=600)
+def _download_excel_files(*urls):
+    """
+    Download and parse Excel files concurrently (each one is an independent
+    HTTP round-trip); cached so widget reruns skip the network entirely.
+    """
+    session = _http_session()
+    with ThreadPoolExecutor(max_workers=len(urls)) as executor:
+        return list(executor.map(lambda url: _fetch_excel(url, session), urls))
+
+def load_files_from_github(*urls):
+    """Load Excel files from GitHub URLs. Returns None for each file on failure."""
+    try:
+        return _download_excel_files(*urls)
+    except Exception as e:
+        st.error(f"Error loading files from GitHub: {e}")
+        return [None] * len(urls)
+
+@st.cache_data(show_spinner=False)
+def read_uploaded_excel(file_bytes: bytes) -> pd.DataFrame:
+    """Parse an uploaded workbook, cached on its contents."""
+    return read_excel_bytes(file_bytes)
+
+
+def _session_memo(key, compute):
+    """
+    Return the result of the last operation if it was computed for the same key,
+    otherwise compute it and keep it in session state for the following reruns.
+    Failed results (None) are not kept so validation errors show up again.
+    """
+    cached = st.session_state.get("op_result")
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    result = compute()
+    failed = result is None or (isinstance(result, tuple) and result[0] is None)
+    if not failed:
+        st.session_state["op_result"] = (key, result)
+    return result
+
+@st.cache_data(ttl=3600, max_entries=8, show_spinner=False)
+def cached_compare_series(file_hash, master_token, rules_token, top_n, _master_df, _comparison_df, _rules_df):
+    """
+    compare_series_logic memoized on the content hashes of its inputs. The frames
+    themselves are passed unhashed (leading underscore) so a hit costs nothing.
+    """
+    return compare_series_logic(_master_df, _comparison_df, _rules_df, top_n)
 
 def similarity_ratio(a, b):
     """Return similarity ratio as percentage with 2 decimal places."""
+    if fuzz is not None:
+        return round(fuzz.ratio(a, b), 2)
     return round(SequenceMatcher(None, a, b).ratio() * 100, 2)
 
+if njit is not None:
+    @njit(cache=True)
+    def _matching_chars(a, b, prev, curr, stack):
+        """
+        Total size of SequenceMatcher's matching blocks for code point arrays a and b
+        (no junk; the caller keeps b shorter than difflib's 200-char autojunk limit).
+        prev/curr/stack are scratch buffers sized for the longest a and b.
+        """
+        total = 0
+        stack[0, 0], stack[0, 1], stack[0, 2], stack[0, 3] = 0, len(a), 0, len(b)
+        top = 1
+        while top > 0:
+            top -= 1
+            alo, ahi, blo, bhi = stack[top, 0], stack[top, 1], stack[top, 2], stack[top, 3]
+            # Longest common block; ties go to the earliest end in a, then in b (as find_longest_match)
+            besti, bestj, bestsize = alo, blo, 0
+            prev[blo:bhi + 1] = 0
+            for i in range(alo, ahi):
+                curr[blo] = 0
+                for j in range(blo, bhi):
+                    k = prev[j] + 1 if a[i] == b[j] else 0
+                    curr[j + 1] = k
+                    if k > bestsize:
+                        besti, bestj, bestsize = i - k + 1, j - k + 1, k
+                prev, curr = curr, prev
+            if bestsize:
+                total += bestsize
+                if alo < besti and blo < bestj:
+                    stack[top, 0], stack[top, 1], stack[top, 2], stack[top, 3] = alo, besti, blo, bestj
+                    top += 1
+                if besti + bestsize < ahi and bestj + bestsize < bhi:
+                    stack[top, 0], stack[top, 1] = besti + bestsize, ahi
+                    stack[top, 2], stack[top, 3] = bestj + bestsize, bhi
+                    top += 1
+        return total
+
+    @njit(parallel=True, cache=True)
+    def _batch_ratio(a_flat, a_off, b_flat, b_off, out, block=1024):
+        # One prange task per block of pairs, so scratch buffers are allocated per block, not per pair
+        a_max = np.max(np.diff(a_off)) if len(out) else 0
+        b_max = np.max(np.diff(b_off)) if len(out) else 0
+        for blk in prange((len(out) + block - 1) // block):
+            prev = np.zeros(b_max + 1, np.int64)
+            curr = np.zeros(b_max + 1, np.int64)
+            stack = np.empty((a_max + b_max + 1, 4), np.int64)
+            for p in range(blk * block, min((blk + 1) * block, len(out))):
+                a = a_flat[a_off[p]:a_off[p + 1]]
+                b = b_flat[b_off[p]:b_off[p + 1]]
+                length = len(a) + len(b)
+                out[p] = 2.0 * _matching_chars(a, b, prev, curr, stack) / length if length else 1.0
+
+def _encode_code_points(strings):
+    """Pack strings into one flat uint32 code point array plus start/end offsets."""
+    lengths = np.fromiter(map(len, strings), dtype=np.int64, count=len(strings))
+    offsets = np.zeros(len(strings) + 1, np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    width = max(int(lengths.max()), 1) if len(strings) else 1
+
+    # A fixed-width numpy unicode array already is UTF-32; take its used cells when padding stays small
+    if width * len(strings) <= 4 * offsets[-1] + (1 << 20):
+        padded = np.array(strings, dtype=f'<U{width}')
+        if np.array_equal(np.char.str_len(padded), lengths):  # numpy drops trailing NULs
+            cells = padded.view(np.uint32).reshape(len(strings), width)
+            return cells[np.arange(cells.shape[1]) < lengths[:, None]], offsets
+    return np.frombuffer(b''.join(s.encode('utf-32-le') for s in strings), dtype=np.uint32), offsets
+
+def _jit_similarity_ratios(left, right):
+    """difflib-identical similarity_ratio for aligned pairs, computed by the numba kernel."""
+    ratios = np.empty(len(left), np.float64)
+    _batch_ratio(*_encode_code_points(left), *_encode_code_points(right), ratios)
+    scores = [round(r * 100, 2) for r in ratios.tolist()]
+    # difflib drops popular characters once b reaches 200 chars; leave those pairs to difflib itself
+    for p, b in enumerate(right):
+        if len(b) >= 200:
+            scores[p] = similarity_ratio(left[p], b)
+    return np.array(scores, dtype=float)
+
+def _char_overlap_bound(left, right, block=4096):
+    """
+    Upper bound on similarity_ratio for aligned pairs: two strings can only match
+    the characters their histograms share. Code points are folded into 128 bins,
+    which can only raise the bound; pairs are processed in blocks to cap memory.
+    """
+    bound = np.empty(len(left), np.float64)
+    for start in range(0, len(left), block):
+        hists, lengths = [], []
+        for strings in (left[start:start + block], right[start:start + block]):
+            flat, offsets = _encode_code_points(strings)
+            counts = np.diff(offsets)
+            bins = np.repeat(np.arange(len(strings)) * 128, counts) + (flat & 127)
+            hists.append(np.bincount(bins, minlength=len(strings) * 128).reshape(-1, 128))
+            lengths.append(counts)
+        total = lengths[0] + lengths[1]
+        common = np.minimum(hists[0], hists[1]).sum(axis=1)
+        bound[start:start + block] = np.where(total > 0, 200.0 * common / np.maximum(total, 1), 100.0)
+    return bound
+
+def similarity_ratios(left, right, score_cutoff=None):
+    """
+    Return similarity_ratio for each aligned pair of strings as a float array.
+    With score_cutoff, RapidFuzz may return 0 for pairs scoring below it.
+    """
+    # Catalog data repeats the same (requested, existing) pair a lot; score each distinct pair once
+    left, right = np.asarray(left, dtype=object), np.asarray(right, dtype=object)
+    left_codes, _ = pd.factorize(left)
+    right_codes, right_uniques = pd.factorize(right)
+    _, first, codes = np.unique(
+        left_codes.astype(np.int64) * len(right_uniques) + right_codes, return_index=True, return_inverse=True
+    )
+    left, right = left[first].tolist(), right[first].tolist()
+
+    if process is not None:
+        scores = process.cpdist(
+            left, right, scorer=fuzz.ratio, score_cutoff=score_cutoff, dtype=np.float64, workers=-1
+        ).round(2)
+    else:
+        # Without rapidfuzz's built-in cutoff, skip pairs whose character overlap cannot reach it
+        scores = np.zeros(len(left), dtype=float)
+        todo = np.arange(len(left))
+        if score_cutoff is not None and len(left):
+            todo = np.flatnonzero(_char_overlap_bound(left, right) >= score_cutoff - 1e-9)
+        left, right = [left[p] for p in todo], [right[p] for p in todo]
+        if njit is not None:
+            scores[todo] = _jit_similarity_ratios(left, right)
+        else:
+            scores[todo] = [similarity_ratio(a, b) for a, b in zip(left, right)]
+    return scores[codes]
+
+# Characters dropped by normalize_series: comma, dash, slash and every whitespace char (same set as regex [,\-\s/])
+_NORM_TBL = dict.fromkeys(i for i in range(0x3001) if chr(i).isspace() or chr(i) in ',-/')
+
 def normalize_series(series_str):
     """Remove common separators and convert to lowercase for comparison."""
-    normalized = re.sub(r'[,\-\s/]', '', str(series_str))
-    return normalized.lower()
+    return str(series_str).translate(_NORM_TBL).lower()
 
 def check_series_match(requested_series, existing_series):
     """
@@ -166,58 +482,101 @@ def check_series_match(requested_series, existing_series):
 
     return "no_match", "NotFound", sim_score
 
-def find_major_contain_series(input_series, lookup_data, key):
+def _series_features(values):
     """
-    Find the most frequently used series that contains the input series.
-    Returns the series name with highest count among containing series.
+    Lowercase, normalized, has-dash and length columns for an array of series strings,
+    computed once per distinct value and expanded back to every row.
     """
-    if key not in lookup_data:
-        return None
+    codes, uniques = pd.factorize(values)
+    uniques = np.asarray(uniques, dtype=object)
+    if pl is not None and all(s.isascii() for s in uniques):
+        # Polars' lowercase and whitespace class agree with str.lower/_NORM_TBL on ASCII text
+        s = pl.Series(uniques, dtype=pl.Utf8)
+        lower = s.str.to_lowercase()
+        features = {
+            'lower': lower.to_numpy(),
+            'norm': lower.str.replace_all(r'[\t\n\x0b\x0c\r\x1c-\x1f ,\-/]', '').to_numpy(),
+            'has_dash': s.str.contains('-', literal=True).to_numpy(),
+            'len': s.str.len_chars().to_numpy().astype(np.int64),
+        }
+    else:
+        s = pd.Series(uniques, dtype=object)
+        features = {
+            'lower': s.str.lower().to_numpy(),
+            'norm': s.str.translate(_NORM_TBL).str.lower().to_numpy(),
+            'has_dash': s.str.contains('-', regex=False).to_numpy(),
+            'len': s.str.len().to_numpy(),
+        }
+    return {name: col[codes] for name, col in features.items()}
 
-    # Get all series for this key and their counts
-    series_counts = {}
-    for series, major_id in lookup_data[key]:
-        # Convert MajorID percentage to count approximation
-        percentage = float(major_id.replace('%', ''))
-        if series in series_counts:
-            series_counts[series] = max(series_counts[series], percentage)
-        else:
-            series_counts[series] = percentage
+def _join_by_group(values, groups, sep):
+    """
+    Join string values per group, keeping row order within each group.
+    Returns a Series indexed by group.
+    """
+    if pl is not None:
+        # Native multi-threaded string aggregation instead of a Python join per group
+        joined = (
+            pl.DataFrame({'group': list(groups), 'value': list(values)})
+            .group_by('group', maintain_order=True)
+            .agg(pl.col('value').str.join(sep))
+        )
+        return pd.Series(joined['value'].to_list(), index=joined['group'].to_list(), dtype=object)
+    return pd.Series(list(values), dtype=object).groupby(list(groups), sort=False).agg(sep.join)
 
-    # Find series that contain the input series
-    containing_series = []
-    input_str = str(input_series).strip()
+def build_major_contain_lookup(master_slim):
+    """
+    Precompute, per key, the valid master series ordered by usage (highest MajorID first).
+    Expects columns key, exist (series as str) and MajorID (float) with invalid series removed.
+    Returns: {key: (stripped_series_array, lowercase_series_array)}
+    """
+    per_series = master_slim.groupby(['key', 'exist'], sort=False, observed=True)['MajorID'].max().reset_index()
+    per_series = per_series.sort_values('MajorID', ascending=False, kind='stable')
 
-    for series, count_percentage in series_counts.items():
-        # Skip invalid series
-        if series in ['', 'nan', 'None']:
-            continue
+    contain_lookup = {}
+    for key, group in per_series.groupby('key', sort=False, observed=True):
+        series = group['exist'].str.strip()
+        contain_lookup[key] = (series.to_numpy(), np.array(series.str.lower(), dtype=str))
+    return contain_lookup
 
-        series_str = str(series).strip()
+def find_major_contain_series(input_series, contain_lookup, key):
+    """
+    Find the most frequently used series that contains the input series.
+    Returns the series name with highest count among containing series.
+    """
+    if key not in contain_lookup:
+        return None
 
-        # Special handling for dash input
-        if input_str == '-':
-            if '-' in series_str:
-                containing_series.append((series_str, count_percentage))
-        else:
-            # Skip dash series when input is not dash
-            if series_str == '-':
-                continue
+    series_arr, lower_arr = contain_lookup[key]
+    input_str = str(input_series).strip()
 
-            # Check containment (case insensitive)
-            if input_str.lower() in series_str.lower():
-                containing_series.append((series_str, count_percentage))
+    # Check containment (case insensitive); dash input matches any series with a dash
+    hits = np.char.find(lower_arr, input_str.lower()) >= 0
+    if input_str != '-':
+        # Skip dash series when input is not dash
+        hits &= series_arr != '-'
 
     # If no containing series found, return None
-    if not containing_series:
+    if not hits.any():
         return None
 
-    # Sort by count percentage (highest first)
-    containing_series.sort(key=lambda x: x[1], reverse=True)
+    # Series are already sorted by usage, so the first hit is the most frequent one
+    return f"Major_contain({series_arr[hits.argmax()]})"
 
-    # Return the most frequent containing series
-    best_series = containing_series[0][0]
-    return f"Major_contain({best_series})"
+def _make_key(df, cols):
+    """
+    Join the given columns into one 'a|b|c' string key per row.
+    Rows are grouped on the columns' integer codes first, so each distinct
+    combination is stringified and joined only once.
+    """
+    combo = np.zeros(len(df), dtype=np.int64)
+    for col in cols:
+        codes, _ = pd.factorize(df[col], use_na_sentinel=False)
+        combo, _ = pd.factorize(combo * (codes.max(initial=-1) + 1) + codes)
+    _, first_rows, inverse = np.unique(combo, return_index=True, return_inverse=True)
+    distinct = df[cols].iloc[first_rows].astype(str)
+    keys = distinct[cols[0]].str.cat([distinct[col] for col in cols[1:]], sep='|').to_numpy(dtype=object)
+    return pd.Series(keys[inverse], index=df.index, dtype=object, name=cols[0])
 
 def calculate_major_id(df):
     """Calculate MajorID percentages for series usage."""
@@ -228,24 +587,20 @@ def calculate_major_id(df):
         st.error(f"Missing columns: {missing_cols}")
         return None
 
-    # Step 1: Create key
-    df['key'] = df[['ManufacturerName', 'Category', 'Family']].astype(str).agg('|'.join, axis=1)
+    # Step 1: Create key (categorical, so grouping and joining on it work on integer codes)
+    df['key'] = pd.Categorical(_make_key(df, ['ManufacturerName', 'Category', 'Family']))
 
     # Step 2: Count how often each RequestedSeries appears per key
-    group_counts = df.groupby(['key', 'RequestedSeries']).size().reset_index(name='count')
+    count = df.groupby(['key', 'RequestedSeries'], sort=False, observed=True)['RequestedSeries'].transform('size')
 
     # Step 3: Count total rows per key
-    total_counts = df.groupby('key').size().reset_index(name='total')
+    total = df.groupby('key', sort=False, observed=True)['key'].transform('size')
 
-    # Step 4: Merge and calculate percentage
-    merged = pd.merge(df, group_counts, on=['key', 'RequestedSeries'], how='left')
-    merged = pd.merge(merged, total_counts, on='key', how='left')
-    merged['MajorID'] = ((merged['count'] / merged['total']) * 100).round(2).astype(str) + '%'
+    # Step 4: Calculate percentage
+    # Stored as a float percentage; the '%' string is only built for the output columns
+    df['MajorID'] = ((count / total) * 100).round(2).astype(np.float32)
 
-    # Drop helper columns
-    merged.drop(columns=['count', 'total'], inplace=True)
-
-    return merged
+    return df
 
 def apply_rules_with_special_case(rules_df, master_df):
     """Apply business rules to the master dataframe."""
@@ -260,19 +615,21 @@ def apply_rules_with_special_case(rules_df, master_df):
     normal_rules = rules_df[rules_df["ManufacturerName"] != "88xx"]
 
     # 1️⃣ Normal matching: create key and merge
-    normal_rules["key"] = normal_rules["ManufacturerName"] + "|" + normal_rules["Category"] + "|" + normal_rules["Family"]
-    master_df["key"] = master_df["ManufacturerName"] + "|" + master_df["Category"] + "|" + master_df["Family"]
+    normal_rules["key"] = _make_key(normal_rules, ["ManufacturerName", "Category", "Family"])
+    master_df["key"] = _make_key(master_df, ["ManufacturerName", "Category", "Family"])
 
     master_df = master_df.merge(normal_rules[["key", "Rule"]], on="key", how="left", suffixes=("", "_rule"))
 
-    # 2️⃣ Special case: match only on Category + Family
-    for _, row in special_case_rules.iterrows():
-        mask = (
-            (master_df["ManufacturerName"] == "88xx") &
-            (master_df["Category"] == row["Category"]) &
-            (master_df["Family"] == row["Family"])
+    # 2️⃣ Special case: match only on Category + Family (the last rule wins for repeated pairs)
+    if not special_case_rules.empty:
+        special_rules = pd.Series(
+            special_case_rules["Rule"].to_numpy(),
+            index=_make_key(special_case_rules, ["Category", "Family"]),
         )
-        master_df.loc[mask, "Rule"] = row["Rule"]
+        special_rules = special_rules[~special_rules.index.duplicated(keep="last")]
+        special_keys = _make_key(master_df[master_df["ManufacturerName"] == "88xx"], ["Category", "Family"])
+        special_keys = special_keys[special_keys.isin(special_rules.index)]
+        master_df.loc[special_keys.index, "Rule"] = special_keys.map(special_rules)
 
     # Drop helper key column
     if "key" in master_df.columns:
@@ -300,146 +657,154 @@ def compare_series_logic(master_df, comparison_df, rules_df=None, top_n=1):
         return None
 
 
-    # Create matching keys
-    df1_with_majorid['key'] = df1_with_majorid[['ManufacturerName', 'Category', 'Family']].astype(str).agg('|'.join, axis=1)
-    comparison_df['key'] = comparison_df[['ManufacturerName', 'Category', 'Family']].astype(str).agg('|'.join, axis=1)
-
-    # Lookup dict: key -> [(RequestedSeries, MajorID)]
-    lookup = defaultdict(list)
-    for _, row in df1_with_majorid.iterrows():
-        lookup[row['key']].append((str(row['RequestedSeries']), row['MajorID']))
-
-    # Store results for all rows
-    result_rows = []
-
-    for _, row in comparison_df.iterrows():
-        key = row['key']
-        series = str(row['RequestedSeries'])
-
-        # Most used series for the key
-        if key in lookup:
-            temp_df = pd.DataFrame(lookup[key], columns=['Series', 'MajorID'])
-            # Filter out invalid values, but keep dashes if requested series is dash
-            if series == '-':
-                temp_df = temp_df[~temp_df['Series'].isin(['', 'nan', 'None'])]
-            else:
-                temp_df = temp_df[~temp_df['Series'].isin(['-', '', 'nan', 'None'])]
-
-            if not temp_df.empty:
-                # Convert MajorID percentage to numeric for sorting
-                temp_df['MajorID_numeric'] = temp_df['MajorID'].str.replace('%', '').astype(float)
-                temp_df = temp_df.groupby('Series', as_index=False)['MajorID_numeric'].max()
-                sorted_list = temp_df.sort_values('MajorID_numeric', ascending=False)
-                top_values = [f"{row.Series}({row.MajorID_numeric}%)" for _, row in sorted_list.head(top_n).iterrows()]
-                most_used_series = " | ".join(top_values)
-            else:
-                most_used_series = None
-        else:
-            most_used_series = None
-
-        # Calculate major_Sim
-        major_sim = find_major_contain_series(series, lookup, key)
-
-        if key not in lookup:
-            # No matches found
-            new_row = row.copy()
-            new_row['comments'] = 'NotFound'
-            new_row['MajorID'] = None
-            new_row['FoundSeries'] = None
-            new_row['MostUsedSeries'] = most_used_series
-            new_row['similar_percentage'] = None
-            new_row['AllSimilarAbove85'] = None
-            new_row['major_Sim'] = major_sim
-            result_rows.append(new_row)
-            continue
-
-        # Find all matches using enhanced matching logic
-        matches = []
-        match_priority = {
-            "exact": 1,
-            "case_sensitive": 2,
-            "nan_alpha": 3,
-            "contain": 4,
-            "similar": 5,
-            "no_match": 6
-        }
+    # Create matching keys (the master key is already set by calculate_major_id)
+    comparison_df['key'] = _make_key(comparison_df, ['ManufacturerName', 'Category', 'Family'])
 
-        for existing_series, maj_id in lookup[key]:
-            match_type, comment, score = check_series_match(series, existing_series)
-
-            if match_type == "exact":
-                matches.append({
-                    'type': match_type,
-                    'comment': comment,
-                    'score': score,
-                    'series': existing_series,
-                    'major_id': maj_id,
-                    'priority': match_priority[match_type]
-                })
-                break
-
-            elif match_type != "no_match":
-                matches.append({
-                    'type': match_type,
-                    'comment': comment,
-                    'score': score,
-                    'series': existing_series,
-                    'major_id': maj_id,
-                    'priority': match_priority[match_type]
-                })
-
-        # Calculate all matches above 85% similarity
-        if series == '-':
-            valid_series = [s for s, _ in lookup[key] if s not in ['', 'nan', 'None']]
-            sim_scores = [(s, similarity_ratio(series, s)) for s in valid_series if '-' in s]
-        else:
-            valid_series = [s for s, _ in lookup[key] if s not in ['-', '', 'nan', 'None']]
-            sim_scores = [(s, similarity_ratio(series, s)) for s in valid_series]
-
-        sim_scores.sort(key=lambda x: x[1], reverse=True)
-        above_85 = [f"{s}({score}%)" for s, score in sim_scores if score >= 85]
-        all_similar_above_85_str = ", ".join(above_85) if above_85 else None
-
-        # Create the new row
-        new_row = row.copy()
-        new_row['MostUsedSeries'] = most_used_series
-        new_row['AllSimilarAbove85'] = all_similar_above_85_str
-        new_row['major_Sim'] = major_sim
-
-        if not matches:
-            new_row['comments'] = 'NotFound'
-            new_row['MajorID'] = None
-            new_row['FoundSeries'] = None
-            new_row['similar_percentage'] = None
-        else:
-            # Sort matches by priority, then by score
-            matches.sort(key=lambda x: (x['priority'], -x['score']))
-            best_match = matches[0]
-
-            # Special case for dash requests
-            if series == '-':
-                dash_matches = [m for m in matches if '-' in m['series']]
-                if not dash_matches:
-                    new_row['comments'] = 'NotFound'
-                    new_row['MajorID'] = None
-                    new_row['FoundSeries'] = None
-                    new_row['similar_percentage'] = None
-                else:
-                    best_dash_match = dash_matches[0]
-                    new_row['comments'] = best_dash_match['comment']
-                    new_row['MajorID'] = best_dash_match['major_id']
-                    new_row['FoundSeries'] = best_dash_match['series']
-                    new_row['similar_percentage'] = best_dash_match['score']
-            else:
-                new_row['comments'] = best_match['comment']
-                new_row['MajorID'] = best_match['major_id']
-                new_row['FoundSeries'] = best_match['series']
-                new_row['similar_percentage'] = best_match['score']
-
-        result_rows.append(new_row)
-
-    # Create final dataframe
-    df_final = pd.DataFrame(result_rows)
+    requested = comparison_df['RequestedSeries'].astype(str)
+    is_dash_request = (requested == '-').to_numpy()
+    master_keys = df1_with_majorid['key'].array
+    # Share the master categories so the merge below joins on integer codes
+    comparison_keys = pd.Categorical(comparison_df['key'], categories=master_keys.categories)
+    in_lookup = comparison_keys.codes >= 0
+
+    # Only master rows whose key was requested can match anything
+    relevant = np.isin(master_keys.codes, comparison_keys.codes)
+    master_series = df1_with_majorid['RequestedSeries'][relevant].astype(str)
+
+    # Identical (key, series) requests get identical results, so each distinct request is matched once
+    series_codes, series_uniques = pd.factorize(requested)
+    _, first_rows, request_id = np.unique(
+        comparison_keys.codes.astype(np.int64) * (len(series_uniques) + 1) + series_codes,
+        return_index=True, return_inverse=True,
+    )
+    distinct_requested = requested.iloc[first_rows]
+
+    # Step 1: One row per (distinct request, existing series) candidate pair, in lookup order.
+    # Lowercase/normalized forms are computed once per distinct series string,
+    # then carried through the merge instead of being recomputed for every pair.
+    exist_features = _series_features(master_series.to_numpy())
+    req_features = _series_features(distinct_requested.to_numpy())
+    master_slim = pd.DataFrame({
+        'key': master_keys[relevant],
+        'pos': np.flatnonzero(relevant),
+        'exist': master_series.to_numpy(),
+        'MajorID': df1_with_majorid['MajorID'].to_numpy()[relevant],
+        'exist_lower': exist_features['lower'],
+        'exist_norm': exist_features['norm'],
+        'exist_valid': (~master_series.isin(['', 'nan', 'None'])).to_numpy(),
+        'exist_has_dash': exist_features['has_dash'],
+        'exist_len': exist_features['len'],
+    })
+    # Repeated (key, series) rows always score the same, so each distinct one is matched once
+    # (keeping its first position in lookup order); AllSimilarAbove85 expands them back below
+    distinct_slim = master_slim.drop_duplicates(['key', 'exist'])
+    pairs = pd.DataFrame({
+        'orig_idx': np.arange(len(first_rows)),
+        'key': comparison_keys[first_rows],
+        'req': distinct_requested.to_numpy(),
+        'req_lower': req_features['lower'],
+        'req_norm': req_features['norm'],
+        'req_is_dash': is_dash_request[first_rows],
+        'req_len': req_features['len'],
+    }).merge(distinct_slim, on='key', how='inner', sort=False)
+    req, exist = pairs['req'], pairs['exist']
+    req_norm, exist_norm = pairs['req_norm'], pairs['exist_norm']
+
+    # Step 2: Classify every pair at once (same rules as check_series_match)
+    pair_is_dash = pairs['req_is_dash']
+    exist_has_dash = pairs['exist_has_dash']
+    # Pairs that take part in matching and in the AllSimilarAbove85 list
+    eligible = pairs['exist_valid'] & np.where(pair_is_dash, exist_has_dash, exist != '-')
+    regular = eligible & ~pair_is_dash
+
+    exact = regular & (req == exist)
+    case_sensitive = regular & ~exact & (pairs['req_lower'] == pairs['exist_lower'])
+    nan_alpha = regular & ~exact & ~case_sensitive & (req_norm == exist_norm)
+    undecided = regular & ~exact & ~case_sensitive & ~nan_alpha
+    # Containment in either direction, checked element-wise on fixed-width string arrays
+    undecided_req = req_norm[undecided].to_numpy(dtype=str)
+    undecided_exist = exist_norm[undecided].to_numpy(dtype=str)
+    contain = pd.Series(False, index=pairs.index)
+    contain[undecided] = (
+        (np.char.find(undecided_req, undecided_exist) >= 0) | (np.char.find(undecided_exist, undecided_req) >= 0)
+    )
+    contain |= eligible & pair_is_dash
+
+    # Similarity is only needed for pairs that are not already decided as 100%.
+    # Contain matches report their score; any other pair only matters once it reaches 60%
+    # (59.995 rounds to 60). Both scorers are capped by 2*min(len)/(len_a+len_b), so pairs
+    # whose lengths differ too much for that are skipped without comparing characters.
+    sim = pd.Series(0.0, index=pairs.index)
+    sim[exact] = 100.0
+    needs_sim = eligible & ~exact
+    upper_bound = 200 * np.minimum(pairs['req_len'], pairs['exist_len']) / (pairs['req_len'] + pairs['exist_len'])
+    scored = needs_sim & contain
+    sim[scored] = similarity_ratios(req[scored], exist[scored])
+    candidates = needs_sim & ~contain & (upper_bound >= 59.995)
+    sim[candidates] = similarity_ratios(req[candidates], exist[candidates], score_cutoff=59.995)
+    similar = undecided & ~contain & (sim >= 60)
+
+    pairs['priority'] = np.select([exact, case_sensitive, nan_alpha, contain, similar], [1, 2, 3, 4, 5], default=6)
+    pairs['score'] = np.where(pairs['priority'] <= 3, 100.0, sim)
+    pairs['sim'] = sim
+
+    # Step 3: Best match per requested row - lowest priority, then highest score, then lookup order
+    best = (
+        pairs[pairs['priority'] < 6]
+        .sort_values(['orig_idx', 'priority', 'score', 'pos'], ascending=[True, True, False, True])
+        .drop_duplicates('orig_idx')
+        .set_index('orig_idx')
+    )
+    best['comments'] = np.select(
+        [best['priority'] == 1, best['priority'] == 2, best['priority'] == 3, best['priority'] == 4],
+        ['insertedBeforeExact', 'Exact(caseSensitive)', 'NanAlphaCase', 'FoundWithDiff(contain)'],
+        default='similar_' + best['score'].astype(str) + '%',
+    )
+
+    # Step 4: All matches above 85% similarity, highest first, one entry per master row
+    above_85 = (
+        pairs.loc[eligible & (sim >= 85), ['orig_idx', 'key', 'exist', 'sim']]
+        .merge(master_slim[['key', 'exist', 'pos']], on=['key', 'exist'])
+        .sort_values(['orig_idx', 'sim', 'pos'], ascending=[True, False, True])
+    )
+    above_85_str = _join_by_group(
+        above_85['exist'] + '(' + above_85['sim'].astype(str) + '%)', above_85['orig_idx'], ', '
+    )
+
+    # Step 5: Most used series per key, with and without dash series
+    master_slim = master_slim[master_slim['exist_valid']]
+
+    def _most_used(slim):
+        per_series = slim.groupby(['key', 'exist'], as_index=False, observed=True)['MajorID'].max()
+        # Series with equal MajorID are listed alphabetically, so the top N does not depend on sort internals
+        per_series = per_series.sort_values(['key', 'MajorID', 'exist'], ascending=[True, False, True])
+        top = per_series.groupby('key', observed=True).head(top_n)
+        labels = top['exist'] + '(' + top['MajorID'].astype(str) + '%)'
+        return _join_by_group(labels, top['key'].astype(str), ' | ')
+
+    most_used_series = np.where(
+        is_dash_request,
+        comparison_df['key'].map(_most_used(master_slim)),
+        comparison_df['key'].map(_most_used(master_slim[master_slim['exist'] != '-'])),
+    )
+
+    # Step 6: Assemble the result frame
+    df_final = comparison_df.copy()
+    df_final['MostUsedSeries'] = most_used_series
+    df_final['AllSimilarAbove85'] = above_85_str.reindex(request_id).to_numpy()
+    # major_Sim only depends on (key, series), so each distinct pair is looked up once
+    contain_lookup = build_major_contain_lookup(master_slim)
+    major_sim_cache = {}
+    for key, series in zip(comparison_df['key'], requested):
+        if (key, series) not in major_sim_cache:
+            major_sim_cache[key, series] = find_major_contain_series(series, contain_lookup, key)
+    df_final['major_Sim'] = [major_sim_cache[key, series] for key, series in zip(comparison_df['key'], requested)]
+    df_final['comments'] = best['comments'].reindex(request_id).fillna('NotFound').to_numpy()
+    df_final['MajorID'] = (best['MajorID'].astype(str) + '%').reindex(request_id).to_numpy()
+    df_final['FoundSeries'] = best['exist'].reindex(request_id).to_numpy()
+    df_final['similar_percentage'] = best['score'].reindex(request_id).to_numpy()
+    df_final = df_final.astype({col: object for col in ['MostUsedSeries', 'AllSimilarAbove85', 'MajorID', 'FoundSeries']})
+    df_final.loc[~in_lookup, 'MostUsedSeries'] = None
 
     # Apply business rules if provided
     if rules_df is not None:
@@ -447,6 +812,43 @@ def compare_series_logic(master_df, comparison_df, rules_df=None, top_n=1):
 
     return df_final
 
+def _key_candidates(target_df, other_df, key_cols):
+    """
+    Positions of target rows whose first key column (as string) occurs in other_df.
+    Only these can match on the full key, so the MultiIndex is built for them alone.
+    """
+    first = key_cols[0]
+    return np.flatnonzero(target_df[first].astype(str).isin(other_df[first].astype(str).unique()))
+
+def _upsert_by_keys(target_df, update_df, key_cols, value_col):
+    """
+    Overwrite value_col on target rows whose key columns (compared as strings)
+    appear in update_df and append the update rows with unknown keys.
+    When a key is repeated in update_df the last value wins. Inputs are left untouched.
+    Returns: (result_df, updated_count, appended_count)
+    """
+    candidates = _key_candidates(target_df, update_df, key_cols)
+    target_keys = pd.MultiIndex.from_frame(target_df[key_cols].iloc[candidates].astype(str))
+    update_keys = pd.MultiIndex.from_frame(update_df[key_cols].astype(str))
+    is_existing = update_keys.isin(target_keys)
+
+    # Existing keys - write the latest value per key into the value column by position
+    is_last = is_existing & ~update_keys.duplicated(keep='last')
+    positions = update_keys[is_last].get_indexer(target_keys)
+    hits = positions >= 0
+    result_df = target_df
+    if hits.any():
+        values = target_df[value_col].to_numpy(dtype=object, copy=True)
+        values[candidates[hits]] = update_df[value_col].to_numpy(dtype=object)[is_last][positions[hits]]
+        result_df = target_df.assign(**{value_col: values})
+
+    # Unknown keys - append as new rows
+    new_rows = update_df[~is_existing]
+    if len(new_rows):
+        result_df = pd.concat([result_df, new_rows], ignore_index=True)
+
+    return result_df, int(is_existing.sum()), len(new_rows)
+
 def update_master_series_logic(update_df, master_df):
     """Update master series logic."""
     # Validate required columns
@@ -457,45 +859,19 @@ def update_master_series_logic(update_df, master_df):
         st.error(f"Update file missing columns: {missing_cols}")
         return None, 0, 0
 
-    # Create composite key for both dataframes
-    update_df['composite_key'] = (update_df['VariantID'].astype(str) + '|' +
-                                update_df['ManufacturerName'].astype(str) + '|' +
-                                update_df['Category'].astype(str) + '|' +
-                                update_df['Family'].astype(str))
-
-    master_df['composite_key'] = (master_df['VariantID'].astype(str) + '|' +
-                                master_df['ManufacturerName'].astype(str) + '|' +
-                                master_df['Category'].astype(str) + '|' +
-                                master_df['Family'].astype(str))
-
-    updated_count = 0
-    appended_count = 0
-    original_len = len(master_df)
-
-    # Process each row in update file
-    for _, update_row in update_df.iterrows():
-        key = update_row['composite_key']
-        mask = master_df['composite_key'] == key
-
-        if mask.any():
-            # Key exists - update RequestedSeries
-            master_df.loc[mask, 'RequestedSeries'] = update_row['RequestedSeries']
-            updated_count += 1
-        else:
-            # Key doesn't exist - append new row
-            new_row = update_row.drop('composite_key').to_dict()
-            # Ensure all required columns from master are present
-            for col in master_df.columns:
-                if col not in new_row and col != 'composite_key':
-                    new_row[col] = None
-
-            master_df = pd.concat([master_df, pd.DataFrame([new_row])], ignore_index=True)
-            appended_count += 1
-
-    # Remove composite_key column
-    master_df = master_df.drop('composite_key', axis=1)
+    return _upsert_by_keys(master_df, update_df, required_cols[:-1], 'RequestedSeries')
 
-    return master_df, updated_count, appended_count
+def _delete_by_keys(target_df, delete_df, key_cols):
+    """
+    Drop rows of target_df whose key columns (compared as strings) appear in delete_df.
+    Returns: (remaining_df, deleted_count)
+    """
+    candidates = _key_candidates(target_df, delete_df, key_cols)
+    delete_idx = pd.MultiIndex.from_frame(delete_df[key_cols].astype(str).drop_duplicates())
+    target_idx = pd.MultiIndex.from_frame(target_df[key_cols].iloc[candidates].astype(str))
+    hits = np.zeros(len(target_df), dtype=bool)
+    hits[candidates] = target_idx.isin(delete_idx)
+    return target_df[~hits], int(hits.sum())
 
 def delete_from_master_series_logic(delete_df, master_df):
     """Delete from master series logic."""
@@ -507,29 +883,7 @@ def delete_from_master_series_logic(delete_df, master_df):
         st.error(f"Delete file missing columns: {missing_cols}")
         return None, 0
 
-    # Create composite key for both dataframes
-    delete_df['composite_key'] = (delete_df['VariantID'].astype(str) + '|' +
-                                delete_df['ManufacturerName'].astype(str) + '|' +
-                                delete_df['Category'].astype(str) + '|' +
-                                delete_df['Family'].astype(str))
-
-    master_df['composite_key'] = (master_df['VariantID'].astype(str) + '|' +
-                                master_df['ManufacturerName'].astype(str) + '|' +
-                                master_df['Category'].astype(str) + '|' +
-                                master_df['Family'].astype(str))
-
-    # Get keys to delete
-    keys_to_delete = set(delete_df['composite_key'].tolist())
-    original_count = len(master_df)
-
-    # Filter out rows with keys to delete
-    master_df = master_df[~master_df['composite_key'].isin(keys_to_delete)]
-    deleted_count = original_count - len(master_df)
-
-    # Remove composite_key column
-    master_df = master_df.drop('composite_key', axis=1)
-
-    return master_df, deleted_count
+    return _delete_by_keys(master_df, delete_df, required_cols)
 
 def update_series_rules_logic(update_df, rules_df):
     """Update series rules logic."""
@@ -541,42 +895,7 @@ def update_series_rules_logic(update_df, rules_df):
         st.error(f"Update file missing columns: {missing_cols}")
         return None, 0, 0
 
-    # Create composite key for both dataframes
-    update_df['composite_key'] = (update_df['ManufacturerName'].astype(str) + '|' +
-                                update_df['Category'].astype(str) + '|' +
-                                update_df['Family'].astype(str))
-
-    rules_df['composite_key'] = (rules_df['ManufacturerName'].astype(str) + '|' +
-                               rules_df['Category'].astype(str) + '|' +
-                               rules_df['Family'].astype(str))
-
-    updated_count = 0
-    appended_count = 0
-
-    # Process each row in update file
-    for _, update_row in update_df.iterrows():
-        key = update_row['composite_key']
-        mask = rules_df['composite_key'] == key
-
-        if mask.any():
-            # Key exists - update Rule
-            rules_df.loc[mask, 'Rule'] = update_row['Rule']
-            updated_count += 1
-        else:
-            # Key doesn't exist - append new row
-            new_row = update_row.drop('composite_key').to_dict()
-            # Ensure all required columns from rules are present
-            for col in rules_df.columns:
-                if col not in new_row and col != 'composite_key':
-                    new_row[col] = None
-
-            rules_df = pd.concat([rules_df, pd.DataFrame([new_row])], ignore_index=True)
-            appended_count += 1
-
-    # Remove composite_key column
-    rules_df = rules_df.drop('composite_key', axis=1)
-
-    return rules_df, updated_count, appended_count
+    return _upsert_by_keys(rules_df, update_df, required_cols[:-1], 'Rule')
 
 def delete_from_series_rules_logic(delete_df, rules_df):
     """Delete from series rules logic."""
@@ -588,27 +907,7 @@ def delete_from_series_rules_logic(delete_df, rules_df):
         st.error(f"Delete file missing columns: {missing_cols}")
         return None, 0
 
-    # Create composite key for both dataframes
-    delete_df['composite_key'] = (delete_df['ManufacturerName'].astype(str) + '|' +
-                                delete_df['Category'].astype(str) + '|' +
-                                delete_df['Family'].astype(str))
-
-    rules_df['composite_key'] = (rules_df['ManufacturerName'].astype(str) + '|' +
-                               rules_df['Category'].astype(str) + '|' +
-                               rules_df['Family'].astype(str))
-
-    # Get keys to delete
-    keys_to_delete = set(delete_df['composite_key'].tolist())
-    original_count = len(rules_df)
-
-    # Filter out rows with keys to delete
-    rules_df = rules_df[~rules_df['composite_key'].isin(keys_to_delete)]
-    deleted_count = original_count - len(rules_df)
-
-    # Remove composite_key column
-    rules_df = rules_df.drop('composite_key', axis=1)
-
-    return rules_df, deleted_count
+    return _delete_by_keys(rules_df, delete_df, required_cols)
 
 # Streamlit App
 def main():
@@ -629,8 +928,7 @@ def main():
 
     # Load master files from GitHub
     with st.spinner("Loading master files from GitHub..."):
-        master_df = load_file_from_github(MASTER_URL)
-        rules_df  = load_file_from_github(RULES_URL)
+        master_df, rules_df = load_files_from_github(MASTER_URL, RULES_URL)
 
     if master_df is None or rules_df is None:
         st.error("Failed to load master files from GitHub")
@@ -662,20 +960,29 @@ def main():
 
     if uploaded_file is not None:
         try:
-            uploaded_df = pd.read_excel(uploaded_file, engine='openpyxl')
+            file_bytes = uploaded_file.getvalue()
+            uploaded_df = read_uploaded_excel(file_bytes)
             st.success(f"✅ File uploaded successfully: {len(uploaded_df)} rows")
             
             # Show preview of uploaded data
             st.subheader("📊 Data Preview")
             st.dataframe(uploaded_df.head(), use_container_width=True)
 
-            # Execute operation based on selection
+            # Execute operation based on selection. The executed operation is
+            # remembered per uploaded file and master/rules content so that later
+            # reruns (checkboxes, download clicks) keep showing its results without
+            # recomputing, and a reloaded master or rules file is never served stale.
+            op_key = (operation, _file_hash(file_bytes), _frame_token(master_df), _frame_token(rules_df))
             if st.button("🚀 Execute Operation", type="primary"):
+                st.session_state["active_op"] = op_key
+
+            if st.session_state.get("active_op") == op_key:
                 with st.spinner("Processing..."):
                     if operation.startswith("1"):
                         # Update Master Series History
                         st.subheader("📝 Updating Master Series History")
-                        updated_master, updated_count, appended_count = update_master_series_logic(uploaded_df, master_df.copy())
+                        updated_master, updated_count, appended_count = _session_memo(
+                            op_key, lambda: update_master_series_logic(uploaded_df, master_df))
                         
                         if updated_master is not None:
                             st.success(f"✅ Update completed!")
@@ -683,16 +990,17 @@ def main():
                             st.info(f"📊 Appended new rows: {appended_count}")
                             st.info(f"📊 Total rows: {len(updated_master)}")
                             
+                            # Serialize once; the same bytes feed the download button and the GitHub payload
+                            xlsx_bytes = df_to_xlsx_bytes(updated_master)
+
                             # Create download buttons and stage GitHub payload
                             col1, col2 = st.columns(2)
                             
                             with col1:
                                 # Download button
-                                output = io.BytesIO()
-                                updated_master.to_excel(output, index=False, engine='openpyxl')
                                 st.download_button(
                                     label="💾 Download Updated Master Series",
-                                    data=output.getvalue(),
+                                    data=xlsx_bytes,
                                     file_name=f"Updated_MasterSeriesHistory_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx",
                                     mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
                                 )
@@ -700,7 +1008,7 @@ def main():
                             with col2:
                                 # Stage payload for global push section
                                 st.session_state["gh_payload"] = {
-                                    "bytes": df_to_xlsx_bytes(updated_master),
+                                    "bytes": xlsx_bytes,
                                     "path": MASTER_FILE_PATH,  # ← from secrets if set
                                     "message": f"Update MasterSeriesHistory - {updated_count} updated, {appended_count} new rows",
                                 }
@@ -713,23 +1021,24 @@ def main():
                         
                         confirm = st.checkbox("I confirm I want to delete these rows")
                         if confirm:
-                            updated_master, deleted_count = delete_from_master_series_logic(uploaded_df, master_df.copy())
+                            updated_master, deleted_count = _session_memo(
+                                op_key, lambda: delete_from_master_series_logic(uploaded_df, master_df))
                             
                             if updated_master is not None:
                                 st.success(f"✅ Deletion completed!")
                                 st.info(f"🗑️ Deleted rows: {deleted_count}")
                                 st.info(f"📊 Remaining rows: {len(updated_master)}")
                                 
+                                xlsx_bytes = df_to_xlsx_bytes(updated_master)
+
                                 # Create download buttons and stage GitHub payload
                                 col1, col2 = st.columns(2)
                                 
                                 with col1:
                                     # Download button
-                                    output = io.BytesIO()
-                                    updated_master.to_excel(output, index=False, engine='openpyxl')
                                     st.download_button(
                                         label="💾 Download Updated Master Series",
-                                        data=output.getvalue(),
+                                        data=xlsx_bytes,
                                         file_name=f"Deleted_MasterSeriesHistory_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx",
                                         mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
                                     )
@@ -737,7 +1046,7 @@ def main():
                                 with col2:
                                     # Stage payload for global push section
                                     st.session_state["gh_payload"] = {
-                                        "bytes": df_to_xlsx_bytes(updated_master),
+                                        "bytes": xlsx_bytes,
                                         "path": MASTER_FILE_PATH,  # ← from secrets if set
                                         "message": f"Delete from MasterSeriesHistory - {deleted_count} rows deleted",
                                     }
@@ -748,7 +1057,8 @@ def main():
                     elif operation.startswith("3"):
                         # Update Series Rules
                         st.subheader("📝 Updating Series Rules")
-                        updated_rules, updated_count, appended_count = update_series_rules_logic(uploaded_df, rules_df.copy())
+                        updated_rules, updated_count, appended_count = _session_memo(
+                            op_key, lambda: update_series_rules_logic(uploaded_df, rules_df))
                         
                         if updated_rules is not None:
                             st.success(f"✅ Update completed!")
@@ -756,16 +1066,16 @@ def main():
                             st.info(f"📊 Appended new rules: {appended_count}")
                             st.info(f"📊 Total rules: {len(updated_rules)}")
                             
+                            xlsx_bytes = df_to_xlsx_bytes(updated_rules)
+
                             # Create download buttons and stage GitHub payload
                             col1, col2 = st.columns(2)
                             
                             with col1:
                                 # Download button
-                                output = io.BytesIO()
-                                updated_rules.to_excel(output, index=False, engine='openpyxl')
                                 st.download_button(
                                     label="💾 Download Updated Series Rules",
-                                    data=output.getvalue(),
+                                    data=xlsx_bytes,
                                     file_name=f"Updated_SeriesRules_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx",
                                     mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
                                 )
@@ -773,7 +1083,7 @@ def main():
                             with col2:
                                 # Stage payload for global push section
                                 st.session_state["gh_payload"] = {
-                                    "bytes": df_to_xlsx_bytes(updated_rules),
+                                    "bytes": xlsx_bytes,
                                     "path": RULES_FILE_PATH,  # ← from secrets if set
                                     "message": f"Update SeriesRules - {updated_count} updated, {appended_count} new rules",
                                 }
@@ -786,23 +1096,24 @@ def main():
                         
                         confirm = st.checkbox("I confirm I want to delete these rules")
                         if confirm:
-                            updated_rules, deleted_count = delete_from_series_rules_logic(uploaded_df, rules_df.copy())
+                            updated_rules, deleted_count = _session_memo(
+                                op_key, lambda: delete_from_series_rules_logic(uploaded_df, rules_df))
                             
                             if updated_rules is not None:
                                 st.success(f"✅ Deletion completed!")
                                 st.info(f"🗑️ Deleted rules: {deleted_count}")
                                 st.info(f"📊 Remaining rules: {len(updated_rules)}")
                                 
+                                xlsx_bytes = df_to_xlsx_bytes(updated_rules)
+
                                 # Create download buttons and stage GitHub payload
                                 col1, col2 = st.columns(2)
                                 
                                 with col1:
                                     # Download button
-                                    output = io.BytesIO()
-                                    updated_rules.to_excel(output, index=False, engine='openpyxl')
                                     st.download_button(
                                         label="💾 Download Updated Series Rules",
-                                        data=output.getvalue(),
+                                        data=xlsx_bytes,
                                         file_name=f"Deleted_SeriesRules_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx",
                                         mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
                                     )
@@ -810,7 +1121,7 @@ def main():
                                 with col2:
                                     # Stage payload for global push section
                                     st.session_state["gh_payload"] = {
-                                        "bytes": df_to_xlsx_bytes(updated_rules),
+                                        "bytes": xlsx_bytes,
                                         "path": RULES_FILE_PATH,  # ← from secrets if set
                                         "message": f"Delete from SeriesRules - {deleted_count} rules deleted",
                                     }
@@ -831,7 +1142,9 @@ def main():
                         
                         # Perform comparison
                         rules_to_use = rules_df if use_rules else None
-                        result_df = compare_series_logic(master_df.copy(), uploaded_df, rules_to_use, top_n)
+                        result_df = cached_compare_series(
+                            op_key[1], op_key[2], _frame_token(rules_to_use), top_n,
+                            master_df, uploaded_df, rules_to_use)
                         
                         if result_df is not None:
                             st.success(f"✅ Series comparison completed!")
@@ -860,11 +1173,9 @@ def main():
                             st.dataframe(result_df.head(10), use_container_width=True)
                             
                             # Download button
-                            output = io.BytesIO()
-                            result_df.to_excel(output, index=False, engine='openpyxl')
                             st.download_button(
                                 label="💾 Download Comparison Results",
-                                data=output.getvalue(),
+                                data=df_to_xlsx_bytes(result_df),
                                 file_name=f"SeriesComparison_Results_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx",
                                 mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
                             )
@@ -897,6 +1208,8 @@ def main():
                     )
                 if ok:
                     st.success(msg)
+                    # The remote file changed; drop the cached copy
+                    _download_excel_files.clear()
                     # Optional: clear queued payload after successful push
                     # st.session_state.pop("gh_payload", None)
                 else:
@@ -946,7 +1259,7 @@ def main():
         2. **Case Sensitive Match** (100%): Same content, different case
         3. **Normalized Match** (100%): Same after removing separators and case
         4. **Containment Match**: One series contains the other
-        5. **Similarity Match**: ≥60% similarity using SequenceMatcher
+        5. **Similarity Match**: ≥60% similarity using RapidFuzz (difflib fallback)
         
         **Output Columns:**
         - `comments`: Type of match found
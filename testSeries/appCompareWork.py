@@ -1,38 +1,96 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 from difflib import SequenceMatcher
 from collections import defaultdict
 import re
 import requests
 import io
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+try:
+    from rapidfuzz import fuzz, process
+except ImportError:  # fall back to difflib when rapidfuzz is not installed
+    fuzz = process = None
+
+# Excel engines (openpyxl unless calamine/xlsxwriter are installed)
+try:
+    import python_calamine  # noqa: F401
+    EXCEL_READ_ENGINE = 'calamine'
+except ImportError:
+    EXCEL_READ_ENGINE = 'openpyxl'
+try:
+    import xlsxwriter  # noqa: F401
+    EXCEL_WRITE_ENGINE = 'xlsxwriter'
+except ImportError:
+    EXCEL_WRITE_ENGINE = 'openpyxl'
+
 # Configuration
 MASTER_URL = "https://raw.githubusercontent.com/AbdallahHesham44/Series_2/refs/heads/main/MasterSeriesHistory.xlsx"
 RULES_URL = "https://raw.githubusercontent.com/AbdallahHesham44/Series_2/refs/heads/main/SampleSeriesRules.xlsx"
 
-def load_file_from_github(url):
-    """Load Excel file from GitHub URL."""
-    try:
-        response = requests.get(url)
-        response.raise_for_status()
-        return pd.read_excel(io.BytesIO(response.content), engine='openpyxl')
-    except Exception as e:
-        st.error(f"Error loading file from {url}: {e}")
-        return None
+def df_to_xlsx_bytes(df: pd.DataFrame) -> bytes:
+    buf = io.BytesIO()
+    # xlsxwriter would turn DataSheetURL values into hyperlinks (capped per sheet); keep them as text
+    engine_kwargs = {'options': {'strings_to_urls': False}} if EXCEL_WRITE_ENGINE == 'xlsxwriter' else {}
+    with pd.ExcelWriter(buf, engine=EXCEL_WRITE_ENGINE, engine_kwargs=engine_kwargs) as writer:
+        df.to_excel(writer, index=False)
+    return buf.getvalue()
+
+def _fetch_excel(url):
+    response = requests.get(url)
+    response.raise_for_status()
+    return pd.read_excel(io.BytesIO(response.content), engine=EXCEL_READ_ENGINE)
+
+def load_files_from_github(*urls):
+    """Load Excel files from GitHub URLs concurrently. Returns None for each file that failed."""
+    with ThreadPoolExecutor(max_workers=len(urls)) as executor:
+        futures = [executor.submit(_fetch_excel, url) for url in urls]
+
+    # Report errors from the main thread so they reach the Streamlit page
+    results = []
+    for url, future in zip(urls, futures):
+        try:
+            results.append(future.result())
+        except Exception as e:
+            st.error(f"Error loading file from {url}: {e}")
+            results.append(None)
+    return results
 
 def similarity_ratio(a, b):
     """Return similarity ratio as percentage with 2 decimal places."""
+    if fuzz is not None:
+        return round(fuzz.ratio(a, b), 2)
     return round(SequenceMatcher(None, a, b).ratio() * 100, 2)
 
+def similarity_ratios(query, choices):
+    """
+    similarity_ratio of query against every choice, scored in one rapidfuzz call
+    when available.
+    """
+    if process is not None and len(choices):
+        scores = process.cdist([query], choices, scorer=fuzz.ratio, dtype=np.float64)[0]
+        return np.round(scores, 2).tolist()
+    return [similarity_ratio(query, c) for c in choices]
+
+# Separators dropped by normalize_series, compiled once for the per-pair checks
+SEPARATORS_RE = re.compile(r'[,\-\s/]')
+
 def normalize_series(series_str):
     """Remove common separators and convert to lowercase for comparison."""
-    normalized = re.sub(r'[,\-\s/]', '', str(series_str))
+    normalized = SEPARATORS_RE.sub('', str(series_str))
     return normalized.lower()
 
-def check_series_match(requested_series, existing_series):
+def normalize_series_values(values):
+    """normalize_series over a whole array of strings in one vectorized pass."""
+    return pd.Series(values, dtype=object).str.replace(SEPARATORS_RE, '', regex=True).str.lower().tolist()
+
+def check_series_match(requested_series, existing_series, sim_score=None, normalized=None):
     """
     Check different types of matches between requested and existing series.
+    sim_score may carry an already computed similarity_ratio of the pair and
+    normalized the (requested, existing) pair already run through normalize_series.
     Returns: (match_type, comment, similarity_score)
     """
     req_str = str(requested_series)
@@ -45,7 +103,9 @@ def check_series_match(requested_series, existing_series):
     # Special case: if requested is "-", check if existing series contains "-"
     if req_str == '-':
         if '-' in exist_str:
-            return "contain", "FoundWithDiff(contain)", similarity_ratio(req_str, exist_str)
+            if sim_score is None:
+                sim_score = similarity_ratio(req_str, exist_str)
+            return "contain", "FoundWithDiff(contain)", sim_score
         else:
             return "no_match", "NotFound", 0.0
 
@@ -62,21 +122,24 @@ def check_series_match(requested_series, existing_series):
         return "case_sensitive", "Exact(caseSensitive)", 100.0
 
     # 3. Normalize both strings (remove separators and make lowercase)
-    req_normalized = normalize_series(req_str)
-    exist_normalized = normalize_series(exist_str)
+    if normalized is None:
+        normalized = normalize_series(req_str), normalize_series(exist_str)
+    req_normalized, exist_normalized = normalized
 
     # 4. Check if normalized versions are the same (NanAlphaCase)
     if req_normalized == exist_normalized and req_str != exist_str:
         return "nan_alpha", "NanAlphaCase", 100.0
 
+    if sim_score is None:
+        sim_score = similarity_ratio(req_str, exist_str)
+
     # 5. Check containment (bidirectional - either can contain the other)
     if exist_normalized in req_normalized and exist_normalized != req_normalized:
-        return "contain", "FoundWithDiff(contain)", similarity_ratio(req_str, exist_str)
+        return "contain", "FoundWithDiff(contain)", sim_score
     elif req_normalized in exist_normalized and req_normalized != exist_normalized:
-        return "contain", "FoundWithDiff(contain)", similarity_ratio(req_str, exist_str)
+        return "contain", "FoundWithDiff(contain)", sim_score
 
     # 6. Regular similarity check
-    sim_score = similarity_ratio(req_str, exist_str)
     if sim_score >= 60:
         return "similar", f"similar_{sim_score}%", sim_score
 
@@ -128,13 +191,14 @@ def find_major_contain_series(input_series, lookup_data, key):
     if not containing_series:
         return None
 
-    # Sort by count percentage (highest first)
-    containing_series.sort(key=lambda x: x[1], reverse=True)
-
-    # Return the most frequent containing series
-    best_series = containing_series[0][0]
+    # Return the most frequent containing series (the first one listed on ties)
+    best_series = max(containing_series, key=lambda x: x[1])[0]
     return f"Major_contain({best_series})"
 
+def _make_key(df, cols):
+    """Join the given columns into one 'a|b|c' string key per row."""
+    return df[cols[0]].astype(str).str.cat([df[col].astype(str) for col in cols[1:]], sep='|')
+
 def calculate_major_id(df):
     """Calculate MajorID percentages for series usage."""
     required_cols = ['VariantID', 'ManufacturerName', 'Category', 'Family', 'DataSheetURL', 'RequestedSeries']
@@ -145,23 +209,18 @@ def calculate_major_id(df):
         return None
 
     # Step 1: Create key
-    df['key'] = df[['ManufacturerName', 'Category', 'Family']].astype(str).agg('|'.join, axis=1)
+    df['key'] = _make_key(df, ['ManufacturerName', 'Category', 'Family'])
 
     # Step 2: Count how often each RequestedSeries appears per key
-    group_counts = df.groupby(['key', 'RequestedSeries']).size().reset_index(name='count')
+    count = df.groupby(['key', 'RequestedSeries'])['RequestedSeries'].transform('size')
 
     # Step 3: Count total rows per key
-    total_counts = df.groupby('key').size().reset_index(name='total')
-
-    # Step 4: Merge and calculate percentage
-    merged = pd.merge(df, group_counts, on=['key', 'RequestedSeries'], how='left')
-    merged = pd.merge(merged, total_counts, on='key', how='left')
-    merged['MajorID'] = ((merged['count'] / merged['total']) * 100).round(2).astype(str) + '%'
+    total = df.groupby('key')['key'].transform('size')
 
-    # Drop helper columns
-    merged.drop(columns=['count', 'total'], inplace=True)
+    # Step 4: Calculate percentage
+    df['MajorID'] = ((count / total) * 100).round(2).astype(str) + '%'
 
-    return merged
+    return df
 
 def apply_rules_with_special_case(rules_df, master_df):
     """Apply business rules to the master dataframe."""
@@ -176,19 +235,21 @@ def apply_rules_with_special_case(rules_df, master_df):
     normal_rules = rules_df[rules_df["ManufacturerName"] != "88xx"]
 
     # 1️⃣ Normal matching: create key and merge
-    normal_rules["key"] = normal_rules["ManufacturerName"] + "|" + normal_rules["Category"] + "|" + normal_rules["Family"]
-    master_df["key"] = master_df["ManufacturerName"] + "|" + master_df["Category"] + "|" + master_df["Family"]
+    normal_rules["key"] = _make_key(normal_rules, ["ManufacturerName", "Category", "Family"])
+    master_df["key"] = _make_key(master_df, ["ManufacturerName", "Category", "Family"])
 
     master_df = master_df.merge(normal_rules[["key", "Rule"]], on="key", how="left", suffixes=("", "_rule"))
 
-    # 2️⃣ Special case: match only on Category + Family
-    for _, row in special_case_rules.iterrows():
-        mask = (
-            (master_df["ManufacturerName"] == "88xx") &
-            (master_df["Category"] == row["Category"]) &
-            (master_df["Family"] == row["Family"])
+    # 2️⃣ Special case: match only on Category + Family (the last rule wins for repeated pairs)
+    if not special_case_rules.empty:
+        special_rules = pd.Series(
+            special_case_rules["Rule"].to_numpy(),
+            index=_make_key(special_case_rules, ["Category", "Family"]),
         )
-        master_df.loc[mask, "Rule"] = row["Rule"]
+        special_rules = special_rules[~special_rules.index.duplicated(keep="last")]
+        special_keys = _make_key(master_df[master_df["ManufacturerName"] == "88xx"], ["Category", "Family"])
+        special_keys = special_keys[special_keys.isin(special_rules.index)]
+        master_df.loc[special_keys.index, "Rule"] = special_keys.map(special_rules)
 
     # Drop helper key column
     if "key" in master_df.columns:
@@ -215,57 +276,74 @@ def compare_series_logic(master_df, comparison_df, rules_df=None, top_n=1):
         st.error(f"Comparison file missing columns: {set(required_cols_2) - set(comparison_df.columns)}")
         return None
 
-    # Create matching keys
-    df1_with_majorid['key'] = df1_with_majorid[['ManufacturerName', 'Category', 'Family']].astype(str).agg('|'.join, axis=1)
-    comparison_df['key'] = comparison_df[['ManufacturerName', 'Category', 'Family']].astype(str).agg('|'.join, axis=1)
+    # Create matching keys (the master key is already set by calculate_major_id)
+    comparison_df['key'] = _make_key(comparison_df, ['ManufacturerName', 'Category', 'Family'])
 
     # Lookup dict: key -> [(RequestedSeries, MajorID)]
     lookup = defaultdict(list)
-    for _, row in df1_with_majorid.iterrows():
-        lookup[row['key']].append((str(row['RequestedSeries']), row['MajorID']))
+    for key, series, major_id in zip(
+        df1_with_majorid['key'], df1_with_majorid['RequestedSeries'].astype(str), df1_with_majorid['MajorID']
+    ):
+        lookup[key].append((series, major_id))
+    # First MajorID of every series per key, for the exact match fast path
+    lookup_exact = {key: dict(reversed(pairs)) for key, pairs in lookup.items()}
+    # Distinct series per key (first-seen order) and each master row's position among them
+    lookup_distinct = {}
+    for key, pairs in lookup.items():
+        codes, uniques = pd.factorize(np.array([s for s, _ in pairs], dtype=object))
+        lookup_distinct[key] = (
+            list(uniques), [lookup_exact[key][s] for s in uniques], codes, normalize_series_values(uniques)
+        )
+
+    # Most used series per key, built once: (series array, MajorID array) with the highest MajorID first
+    series_stats = pd.DataFrame({
+        'key': df1_with_majorid['key'],
+        'Series': df1_with_majorid['RequestedSeries'].astype(str),
+        'MajorID_numeric': df1_with_majorid['MajorID'].str.replace('%', '').astype(float),
+    })
+    series_stats = (
+        series_stats.groupby(['key', 'Series'], as_index=False)['MajorID_numeric'].max()
+        .sort_values(['key', 'MajorID_numeric'], ascending=[True, False], kind='stable')
+    )
+    most_used_lookup = {
+        key: (group['Series'].to_numpy(), group['MajorID_numeric'].to_numpy())
+        for key, group in series_stats.groupby('key', sort=False)
+    }
+
+    # Repeated (key, series) requests are matched once and fanned out afterwards
+    requested = comparison_df['RequestedSeries'].astype(str).to_numpy(dtype=object)
+    key_codes, _ = pd.factorize(comparison_df['key'])
+    series_codes, series_uniques = pd.factorize(requested)
+    _, first_rows, request_ids = np.unique(
+        key_codes.astype(np.int64) * (len(series_uniques) + 1) + series_codes, return_index=True, return_inverse=True
+    )
 
-    # Store results for all rows
-    result_rows = []
+    requested_normalized = normalize_series_values(requested[first_rows])
 
-    for _, row in comparison_df.iterrows():
-        key = row['key']
-        series = str(row['RequestedSeries'])
+    # Output columns, preallocated and filled per distinct request
+    n = len(first_rows)
+    out = {col: np.empty(n, dtype=object) for col in [
+        'MostUsedSeries', 'AllSimilarAbove85', 'major_Sim', 'comments', 'MajorID', 'FoundSeries', 'similar_percentage'
+    ]}
+    out['comments'][:] = 'NotFound'
 
+    for i, (key, series) in enumerate(zip(comparison_df['key'].to_numpy()[first_rows], requested[first_rows])):
         # Most used series for the key
-        if key in lookup:
-            temp_df = pd.DataFrame(lookup[key], columns=['Series', 'MajorID'])
+        if key in most_used_lookup:
+            series_arr, major_arr = most_used_lookup[key]
             # Filter out invalid values, but keep dashes if requested series is dash
             if series == '-':
-                temp_df = temp_df[~temp_df['Series'].isin(['', 'nan', 'None'])]
+                keep = ~np.isin(series_arr, ['', 'nan', 'None'])
             else:
-                temp_df = temp_df[~temp_df['Series'].isin(['-', '', 'nan', 'None'])]
-
-            if not temp_df.empty:
-                # Convert MajorID percentage to numeric for sorting
-                temp_df['MajorID_numeric'] = temp_df['MajorID'].str.replace('%', '').astype(float)
-                temp_df = temp_df.groupby('Series', as_index=False)['MajorID_numeric'].max()
-                sorted_list = temp_df.sort_values('MajorID_numeric', ascending=False)
-                top_values = [f"{row.Series}({row.MajorID_numeric}%)" for _, row in sorted_list.head(top_n).iterrows()]
-                most_used_series = " | ".join(top_values)
-            else:
-                most_used_series = None
-        else:
-            most_used_series = None
+                keep = ~np.isin(series_arr, ['-', '', 'nan', 'None'])
+            top_values = [f"{s}({m}%)" for s, m in zip(series_arr[keep][:top_n], major_arr[keep][:top_n])]
+            out['MostUsedSeries'][i] = " | ".join(top_values) if top_values else None
 
         # Calculate major_Sim
-        major_sim = find_major_contain_series(series, lookup, key)
+        out['major_Sim'][i] = find_major_contain_series(series, lookup, key)
 
         if key not in lookup:
             # No matches found
-            new_row = row.copy()
-            new_row['comments'] = 'NotFound'
-            new_row['MajorID'] = None
-            new_row['FoundSeries'] = None
-            new_row['MostUsedSeries'] = most_used_series
-            new_row['similar_percentage'] = None
-            new_row['AllSimilarAbove85'] = None
-            new_row['major_Sim'] = major_sim
-            result_rows.append(new_row)
             continue
 
         # Find all matches using enhanced matching logic
@@ -279,54 +357,66 @@ def compare_series_logic(master_df, comparison_df, rules_df=None, top_n=1):
             "no_match": 6
         }
 
-        for existing_series, maj_id in lookup[key]:
-            match_type, comment, score = check_series_match(series, existing_series)
-
-            if match_type == "exact":
-                matches.append({
-                    'type': match_type,
-                    'comment': comment,
-                    'score': score,
-                    'series': existing_series,
-                    'major_id': maj_id,
-                    'priority': match_priority[match_type]
-                })
-                break
-
-            elif match_type != "no_match":
-                matches.append({
-                    'type': match_type,
-                    'comment': comment,
-                    'score': score,
-                    'series': existing_series,
-                    'major_id': maj_id,
-                    'priority': match_priority[match_type]
-                })
-
-        # Calculate all matches above 85% similarity
+        # Similarity against every distinct master series of the key in one call
+        distinct_series, distinct_major_ids, row_codes, distinct_normalized = lookup_distinct[key]
+        distinct_sims = similarity_ratios(series, distinct_series)
+
+        if series in lookup_exact[key] and series not in ['-', '', 'nan', 'None']:
+            # An exact hit outranks every other match type, so the per-series checks can be skipped
+            matches.append({
+                'type': 'exact',
+                'comment': 'insertedBeforeExact',
+                'score': 100.0,
+                'series': series,
+                'major_id': lookup_exact[key][series],
+                'priority': match_priority['exact']
+            })
+        else:
+            for existing_series, maj_id, sim, exist_normalized in zip(
+                distinct_series, distinct_major_ids, distinct_sims, distinct_normalized
+            ):
+                match_type, comment, score = check_series_match(
+                    series, existing_series, sim, (requested_normalized[i], exist_normalized)
+                )
+
+                if match_type == "exact":
+                    matches.append({
+                        'type': match_type,
+                        'comment': comment,
+                        'score': score,
+                        'series': existing_series,
+                        'major_id': maj_id,
+                        'priority': match_priority[match_type]
+                    })
+                    break
+
+                elif match_type != "no_match":
+                    matches.append({
+                        'type': match_type,
+                        'comment': comment,
+                        'score': score,
+                        'series': existing_series,
+                        'major_id': maj_id,
+                        'priority': match_priority[match_type]
+                    })
+
+        # Calculate all matches above 85% similarity (listed once per master row)
+        key_series = [distinct_series[c] for c in row_codes]
+        sims = [distinct_sims[c] for c in row_codes]
         if series == '-':
-            valid_series = [s for s, _ in lookup[key] if s not in ['', 'nan', 'None']]
-            sim_scores = [(s, similarity_ratio(series, s)) for s in valid_series if '-' in s]
+            sim_scores = [(s, sim) for s, sim in zip(key_series, sims)
+                          if s not in ['', 'nan', 'None'] and '-' in s]
         else:
-            valid_series = [s for s, _ in lookup[key] if s not in ['-', '', 'nan', 'None']]
-            sim_scores = [(s, similarity_ratio(series, s)) for s in valid_series]
+            sim_scores = [(s, sim) for s, sim in zip(key_series, sims)
+                          if s not in ['-', '', 'nan', 'None']]
 
         sim_scores.sort(key=lambda x: x[1], reverse=True)
         above_85 = [f"{s}({score}%)" for s, score in sim_scores if score >= 85]
         all_similar_above_85_str = ", ".join(above_85) if above_85 else None
 
-        # Create the new row
-        new_row = row.copy()
-        new_row['MostUsedSeries'] = most_used_series
-        new_row['AllSimilarAbove85'] = all_similar_above_85_str
-        new_row['major_Sim'] = major_sim
-
-        if not matches:
-            new_row['comments'] = 'NotFound'
-            new_row['MajorID'] = None
-            new_row['FoundSeries'] = None
-            new_row['similar_percentage'] = None
-        else:
+        out['AllSimilarAbove85'][i] = all_similar_above_85_str
+
+        if matches:
             # Sort matches by priority, then by score
             matches.sort(key=lambda x: (x['priority'], -x['score']))
             best_match = matches[0]
@@ -334,27 +424,18 @@ def compare_series_logic(master_df, comparison_df, rules_df=None, top_n=1):
             # Special case for dash requests
             if series == '-':
                 dash_matches = [m for m in matches if '-' in m['series']]
-                if not dash_matches:
-                    new_row['comments'] = 'NotFound'
-                    new_row['MajorID'] = None
-                    new_row['FoundSeries'] = None
-                    new_row['similar_percentage'] = None
-                else:
-                    best_dash_match = dash_matches[0]
-                    new_row['comments'] = best_dash_match['comment']
-                    new_row['MajorID'] = best_dash_match['major_id']
-                    new_row['FoundSeries'] = best_dash_match['series']
-                    new_row['similar_percentage'] = best_dash_match['score']
-            else:
-                new_row['comments'] = best_match['comment']
-                new_row['MajorID'] = best_match['major_id']
-                new_row['FoundSeries'] = best_match['series']
-                new_row['similar_percentage'] = best_match['score']
+                best_match = dash_matches[0] if dash_matches else None
 
-        result_rows.append(new_row)
+            if best_match is not None:
+                out['comments'][i] = best_match['comment']
+                out['MajorID'][i] = best_match['major_id']
+                out['FoundSeries'][i] = best_match['series']
+                out['similar_percentage'][i] = best_match['score']
 
     # Create final dataframe
-    df_final = pd.DataFrame(result_rows)
+    df_final = comparison_df.copy()
+    for col, values in out.items():
+        df_final[col] = values[request_ids]
 
     # Apply business rules if provided
     if rules_df is not None:
@@ -362,6 +443,43 @@ def compare_series_logic(master_df, comparison_df, rules_df=None, top_n=1):
 
     return df_final
 
+def _key_candidates(target_df, other_df, key_cols):
+    """
+    Positions of target rows whose first key column (as string) occurs in other_df.
+    Only these can match on the full key, so the MultiIndex is built for them alone.
+    """
+    first = key_cols[0]
+    return np.flatnonzero(target_df[first].astype(str).isin(other_df[first].astype(str).unique()))
+
+def _upsert_by_keys(target_df, update_df, key_cols, value_col):
+    """
+    Overwrite value_col on target rows whose key columns (compared as strings)
+    appear in update_df and append the update rows with unknown keys.
+    When a key is repeated in update_df the last value wins. Inputs are left untouched.
+    Returns: (result_df, updated_count, appended_count)
+    """
+    candidates = _key_candidates(target_df, update_df, key_cols)
+    target_keys = pd.MultiIndex.from_frame(target_df[key_cols].iloc[candidates].astype(str))
+    update_keys = pd.MultiIndex.from_frame(update_df[key_cols].astype(str))
+    is_existing = update_keys.isin(target_keys)
+
+    # Existing keys - write the latest value per key into the value column by position
+    is_last = is_existing & ~update_keys.duplicated(keep='last')
+    positions = update_keys[is_last].get_indexer(target_keys)
+    hits = positions >= 0
+    result_df = target_df
+    if hits.any():
+        values = target_df[value_col].to_numpy(dtype=object, copy=True)
+        values[candidates[hits]] = update_df[value_col].to_numpy(dtype=object)[is_last][positions[hits]]
+        result_df = target_df.assign(**{value_col: values})
+
+    # Unknown keys - append as new rows
+    new_rows = update_df[~is_existing]
+    if len(new_rows):
+        result_df = pd.concat([result_df, new_rows], ignore_index=True)
+
+    return result_df, int(is_existing.sum()), len(new_rows)
+
 def update_master_series_logic(update_df, master_df):
     """Update master series logic."""
     # Validate required columns
@@ -372,45 +490,19 @@ def update_master_series_logic(update_df, master_df):
         st.error(f"Update file missing columns: {missing_cols}")
         return None, 0, 0
 
-    # Create composite key for both dataframes
-    update_df['composite_key'] = (update_df['VariantID'].astype(str) + '|' +
-                                update_df['ManufacturerName'].astype(str) + '|' +
-                                update_df['Category'].astype(str) + '|' +
-                                update_df['Family'].astype(str))
-
-    master_df['composite_key'] = (master_df['VariantID'].astype(str) + '|' +
-                                master_df['ManufacturerName'].astype(str) + '|' +
-                                master_df['Category'].astype(str) + '|' +
-                                master_df['Family'].astype(str))
-
-    updated_count = 0
-    appended_count = 0
-    original_len = len(master_df)
-
-    # Process each row in update file
-    for _, update_row in update_df.iterrows():
-        key = update_row['composite_key']
-        mask = master_df['composite_key'] == key
-
-        if mask.any():
-            # Key exists - update RequestedSeries
-            master_df.loc[mask, 'RequestedSeries'] = update_row['RequestedSeries']
-            updated_count += 1
-        else:
-            # Key doesn't exist - append new row
-            new_row = update_row.drop('composite_key').to_dict()
-            # Ensure all required columns from master are present
-            for col in master_df.columns:
-                if col not in new_row and col != 'composite_key':
-                    new_row[col] = None
+    return _upsert_by_keys(master_df, update_df, required_cols[:-1], 'RequestedSeries')
 
-            master_df = pd.concat([master_df, pd.DataFrame([new_row])], ignore_index=True)
-            appended_count += 1
-
-    # Remove composite_key column
-    master_df = master_df.drop('composite_key', axis=1)
-
-    return master_df, updated_count, appended_count
+def _delete_by_keys(target_df, delete_df, key_cols):
+    """
+    Drop rows of target_df whose key columns (compared as strings) appear in delete_df.
+    Returns: (remaining_df, deleted_count)
+    """
+    candidates = _key_candidates(target_df, delete_df, key_cols)
+    delete_idx = pd.MultiIndex.from_frame(delete_df[key_cols].astype(str).drop_duplicates())
+    target_idx = pd.MultiIndex.from_frame(target_df[key_cols].iloc[candidates].astype(str))
+    hits = np.zeros(len(target_df), dtype=bool)
+    hits[candidates] = target_idx.isin(delete_idx)
+    return target_df[~hits], int(hits.sum())
 
 def delete_from_master_series_logic(delete_df, master_df):
     """Delete from master series logic."""
@@ -422,29 +514,7 @@ def delete_from_master_series_logic(delete_df, master_df):
         st.error(f"Delete file missing columns: {missing_cols}")
         return None, 0
 
-    # Create composite key for both dataframes
-    delete_df['composite_key'] = (delete_df['VariantID'].astype(str) + '|' +
-                                delete_df['ManufacturerName'].astype(str) + '|' +
-                                delete_df['Category'].astype(str) + '|' +
-                                delete_df['Family'].astype(str))
-
-    master_df['composite_key'] = (master_df['VariantID'].astype(str) + '|' +
-                                master_df['ManufacturerName'].astype(str) + '|' +
-                                master_df['Category'].astype(str) + '|' +
-                                master_df['Family'].astype(str))
-
-    # Get keys to delete
-    keys_to_delete = set(delete_df['composite_key'].tolist())
-    original_count = len(master_df)
-
-    # Filter out rows with keys to delete
-    master_df = master_df[~master_df['composite_key'].isin(keys_to_delete)]
-    deleted_count = original_count - len(master_df)
-
-    # Remove composite_key column
-    master_df = master_df.drop('composite_key', axis=1)
-
-    return master_df, deleted_count
+    return _delete_by_keys(master_df, delete_df, required_cols)
 
 def update_series_rules_logic(update_df, rules_df):
     """Update series rules logic."""
@@ -456,42 +526,7 @@ def update_series_rules_logic(update_df, rules_df):
         st.error(f"Update file missing columns: {missing_cols}")
         return None, 0, 0
 
-    # Create composite key for both dataframes
-    update_df['composite_key'] = (update_df['ManufacturerName'].astype(str) + '|' +
-                                update_df['Category'].astype(str) + '|' +
-                                update_df['Family'].astype(str))
-
-    rules_df['composite_key'] = (rules_df['ManufacturerName'].astype(str) + '|' +
-                               rules_df['Category'].astype(str) + '|' +
-                               rules_df['Family'].astype(str))
-
-    updated_count = 0
-    appended_count = 0
-
-    # Process each row in update file
-    for _, update_row in update_df.iterrows():
-        key = update_row['composite_key']
-        mask = rules_df['composite_key'] == key
-
-        if mask.any():
-            # Key exists - update Rule
-            rules_df.loc[mask, 'Rule'] = update_row['Rule']
-            updated_count += 1
-        else:
-            # Key doesn't exist - append new row
-            new_row = update_row.drop('composite_key').to_dict()
-            # Ensure all required columns from rules are present
-            for col in rules_df.columns:
-                if col not in new_row and col != 'composite_key':
-                    new_row[col] = None
-
-            rules_df = pd.concat([rules_df, pd.DataFrame([new_row])], ignore_index=True)
-            appended_count += 1
-
-    # Remove composite_key column
-    rules_df = rules_df.drop('composite_key', axis=1)
-
-    return rules_df, updated_count, appended_count
+    return _upsert_by_keys(rules_df, update_df, required_cols[:-1], 'Rule')
 
 def delete_from_series_rules_logic(delete_df, rules_df):
     """Delete from series rules logic."""
@@ -503,27 +538,7 @@ def delete_from_series_rules_logic(delete_df, rules_df):
         st.error(f"Delete file missing columns: {missing_cols}")
         return None, 0
 
-    # Create composite key for both dataframes
-    delete_df['composite_key'] = (delete_df['ManufacturerName'].astype(str) + '|' +
-                                delete_df['Category'].astype(str) + '|' +
-                                delete_df['Family'].astype(str))
-
-    rules_df['composite_key'] = (rules_df['ManufacturerName'].astype(str) + '|' +
-                               rules_df['Category'].astype(str) + '|' +
-                               rules_df['Family'].astype(str))
-
-    # Get keys to delete
-    keys_to_delete = set(delete_df['composite_key'].tolist())
-    original_count = len(rules_df)
-
-    # Filter out rows with keys to delete
-    rules_df = rules_df[~rules_df['composite_key'].isin(keys_to_delete)]
-    deleted_count = original_count - len(rules_df)
-
-    # Remove composite_key column
-    rules_df = rules_df.drop('composite_key', axis=1)
-
-    return rules_df, deleted_count
+    return _delete_by_keys(rules_df, delete_df, required_cols)
 
 # Streamlit App
 def main():
@@ -538,8 +553,7 @@ def main():
 
     # Load master files from GitHub
     with st.spinner("Loading master files from GitHub..."):
-        master_df = load_file_from_github(MASTER_URL)
-        rules_df = load_file_from_github(RULES_URL)
+        master_df, rules_df = load_files_from_github(MASTER_URL, RULES_URL)
 
     if master_df is None or rules_df is None:
         st.error("Failed to load master files from GitHub")
@@ -571,7 +585,7 @@ def main():
 
     if uploaded_file is not None:
         try:
-            uploaded_df = pd.read_excel(uploaded_file, engine='openpyxl')
+            uploaded_df = pd.read_excel(uploaded_file, engine=EXCEL_READ_ENGINE)
             st.success(f"✅ File uploaded successfully: {len(uploaded_df)} rows")
             
             # Show preview of uploaded data
@@ -584,7 +598,7 @@ def main():
                     if operation.startswith("1"):
                         # Update Master Series History
                         st.subheader("📝 Updating Master Series History")
-                        updated_master, updated_count, appended_count = update_master_series_logic(uploaded_df, master_df.copy())
+                        updated_master, updated_count, appended_count = update_master_series_logic(uploaded_df, master_df)
                         
                         if updated_master is not None:
                             st.success(f"✅ Update completed!")
@@ -593,11 +607,9 @@ def main():
                             st.info(f"📊 Total rows: {len(updated_master)}")
                             
                             # Download button
-                            output = io.BytesIO()
-                            updated_master.to_excel(output, index=False, engine='openpyxl')
                             st.download_button(
                                 label="💾 Download Updated Master Series",
-                                data=output.getvalue(),
+                                data=df_to_xlsx_bytes(updated_master),
                                 file_name=f"Updated_MasterSeriesHistory_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx",
                                 mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
                             )
@@ -609,7 +621,7 @@ def main():
                         
                         confirm = st.checkbox("I confirm I want to delete these rows")
                         if confirm:
-                            updated_master, deleted_count = delete_from_master_series_logic(uploaded_df, master_df.copy())
+                            updated_master, deleted_count = delete_from_master_series_logic(uploaded_df, master_df)
                             
                             if updated_master is not None:
                                 st.success(f"✅ Deletion completed!")
@@ -617,11 +629,9 @@ def main():
                                 st.info(f"📊 Remaining rows: {len(updated_master)}")
                                 
                                 # Download button
-                                output = io.BytesIO()
-                                updated_master.to_excel(output, index=False, engine='openpyxl')
                                 st.download_button(
                                     label="💾 Download Updated Master Series",
-                                    data=output.getvalue(),
+                                    data=df_to_xlsx_bytes(updated_master),
                                     file_name=f"Deleted_MasterSeriesHistory_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx",
                                     mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
                                 )
@@ -631,7 +641,7 @@ def main():
                     elif operation.startswith("3"):
                         # Update Series Rules
                         st.subheader("📝 Updating Series Rules")
-                        updated_rules, updated_count, appended_count = update_series_rules_logic(uploaded_df, rules_df.copy())
+                        updated_rules, updated_count, appended_count = update_series_rules_logic(uploaded_df, rules_df)
                         
                         if updated_rules is not None:
                             st.success(f"✅ Update completed!")
@@ -640,11 +650,9 @@ def main():
                             st.info(f"📊 Total rules: {len(updated_rules)}")
                             
                             # Download button
-                            output = io.BytesIO()
-                            updated_rules.to_excel(output, index=False, engine='openpyxl')
                             st.download_button(
                                 label="💾 Download Updated Series Rules",
-                                data=output.getvalue(),
+                                data=df_to_xlsx_bytes(updated_rules),
                                 file_name=f"Updated_SeriesRules_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx",
                                 mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
                             )
@@ -656,7 +664,7 @@ def main():
                         
                         confirm = st.checkbox("I confirm I want to delete these rules")
                         if confirm:
-                            updated_rules, deleted_count = delete_from_series_rules_logic(uploaded_df, rules_df.copy())
+                            updated_rules, deleted_count = delete_from_series_rules_logic(uploaded_df, rules_df)
                             
                             if updated_rules is not None:
                                 st.success(f"✅ Deletion completed!")
@@ -664,11 +672,9 @@ def main():
                                 st.info(f"📊 Remaining rules: {len(updated_rules)}")
                                 
                                 # Download button
-                                output = io.BytesIO()
-                                updated_rules.to_excel(output, index=False, engine='openpyxl')
                                 st.download_button(
                                     label="💾 Download Updated Series Rules",
-                                    data=output.getvalue(),
+                                    data=df_to_xlsx_bytes(updated_rules),
                                     file_name=f"Deleted_SeriesRules_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx",
                                     mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
                                 )
@@ -688,7 +694,7 @@ def main():
                         
                         # Perform comparison
                         rules_to_use = rules_df if use_rules else None
-                        result_df = compare_series_logic(master_df.copy(), uploaded_df, rules_to_use, top_n)
+                        result_df = compare_series_logic(master_df, uploaded_df, rules_to_use, top_n)
                         
                         if result_df is not None:
                             st.success(f"✅ Series comparison completed!")
@@ -717,11 +723,9 @@ def main():
                             st.dataframe(result_df.head(10), use_container_width=True)
                             
                             # Download button
-                            output = io.BytesIO()
-                            result_df.to_excel(output, index=False, engine='openpyxl')
                             st.download_button(
                                 label="💾 Download Comparison Results",
-                                data=output.getvalue(),
+                                data=df_to_xlsx_bytes(result_df),
                                 file_name=f"SeriesComparison_Results_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx",
                                 mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
                             )
@@ -777,7 +781,7 @@ def main():
         2. **Case Sensitive Match** (100%): Same content, different case
         3. **Normalized Match** (100%): Same after removing separators and case
         4. **Containment Match**: One series contains the other
-        5. **Similarity Match**: ≥60% similarity using SequenceMatcher
+        5. **Similarity Match**: ≥60% similarity using RapidFuzz (difflib fallback)
         
         **Output Columns:**
         - `comments`: Type of match found